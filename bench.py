@@ -0,0 +1,252 @@
+"""Нагрузочный прогон бота без Telegram.
+
+Поднимает локальный поддельный Bot API (aiohttp) с настраиваемой задержкой
+и долей ответов 429, направляет в него настоящий bot из main.py и прогоняет
+через dp поток синтетических обновлений: каждый пользователь жмёт /start,
+«Время и место», «Подарок» и «Приду». В конце печатает пропускную
+способность, p50/p99 обработки, число вызовов API на одно действие
+и записи в хранилище на одно обновление.
+
+    python bench.py --users 2000 --concurrency 100 --latency 30 --throttle 0.01
+
+С --serve-api PORT только поднимает поддельный Bot API (например, для workers.py).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+FAKE_TOKEN = "123456:bench"
+
+# Что делает каждый пользователь, по порядку: (название, текст команды или callback_data)
+SCENARIO = [
+    ("start", "/start"),
+    ("time_info", "time_info"),
+    ("gift_button", "gift_button"),
+    ("will_come", "will_come"),
+]
+
+
+class FakeBotApi:
+    """Поддельный Bot API: отвечает на любые методы с задержкой latency секунд.
+
+    С вероятностью throttle отвечает 429 с retry_after, как Telegram при превышении лимитов.
+    """
+
+    def __init__(self, latency=0.03, throttle=0.0, retry_after=1):
+        self.latency = latency
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.requests = Counter()
+        self.throttled = Counter()
+        self._message_ids = itertools.count(1000)
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        fields = await request.post()
+        self.requests[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.throttle and random.random() < self.throttle:
+            self.throttled[method] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        if method.startswith(("send", "edit")):
+            chat_id = int(fields.get("chat_id", 0) or 0)
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+            }
+            if "text" in fields:
+                result["text"] = fields["text"]
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def serve(self, port):
+        runner, base_url = await self.start(port=port)
+        print(f"Поддельный Bot API: {base_url} (задержка {self.latency * 1000:.0f} мс, 429: {self.throttle:.0%})")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://{host}:{port}"
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def make_update(update_id, user_id, kind, payload):
+    user = {"id": user_id, "is_bot": False, "first_name": f"Гость {user_id}",
+            "username": f"bench_{user_id}", "language_code": "ru"}
+    chat = {"id": user_id, "type": "private"}
+    if kind == "start":
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "chat": chat, "from": user, "text": payload,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(payload)}],
+        }}
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": str(user_id), "from": user, "data": payload,
+        "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "menu"},
+    }}
+
+
+async def run(args):
+    api = FakeBotApi(latency=args.latency / 1000, throttle=args.throttle, retry_after=args.retry_after)
+    api_runner, base_url = await api.start()
+
+    # main.py читает настройки из окружения при импорте
+    data_dir = tempfile.mkdtemp(prefix="bench-")
+    os.environ.update(BOT_TOKEN=FAKE_TOKEN, DATA_DIR=data_dir, STORAGE_BACKEND=args.backend, METRICS_PORT="0")
+    # Отчёт печатается в stdout — журнал бота только с предупреждениями и ошибками
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import main
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+    from metrics import REGISTRY
+
+    main.GIFT_STAGE_DELAY = args.gift_delay
+    main.bot.session.api = TelegramAPIServer.from_base(base_url)
+
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies = defaultdict(list)
+    errors = Counter()
+    update_ids = itertools.count(1)
+
+    async def feed(user_id, kind, payload):
+        update = Update.model_validate(make_update(next(update_ids), user_id, kind, payload),
+                                       context={"bot": main.bot})
+        async with slots:
+            started = time.perf_counter()
+            try:
+                await main.dp.feed_update(main.bot, update)
+            except Exception as e:
+                errors[f"{kind}: {type(e).__name__}"] += 1
+            latencies[kind].append(time.perf_counter() - started)
+
+    async def guest(user_id):
+        for kind, payload in SCENARIO:
+            await feed(user_id, kind, payload)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(guest(100000 + i) for i in range(args.users)))
+    handled_at = time.perf_counter()
+    # Дожидаемся фоновых анимаций подарка и записи на диск
+    while main.gift_tasks:
+        await asyncio.gather(*list(main.gift_tasks.values()), return_exceptions=True)
+    await main.events.close()
+    finished_at = time.perf_counter()
+
+    await main.outbound.close()
+    await main.bot.session.close()
+    await api_runner.cleanup()
+
+    updates = sum(len(values) for values in latencies.values())
+    interactions = args.users * len(SCENARIO)
+    api_calls = sum(count for (name, _), count in REGISTRY.counters.items() if name == "bot_api_calls")
+    flushes = sum(h.count for (name, labels), h in REGISTRY.histograms.items()
+                  if name == "storage_seconds" and dict(labels).get("operation") == "flush")
+    flush_time = sum(h.sum for (name, labels), h in REGISTRY.histograms.items()
+                     if name == "storage_seconds" and dict(labels).get("operation") == "flush")
+    records_written = sum(count for (name, _), count in REGISTRY.counters.items() if name == "storage_records_written")
+    all_latencies = [value for values in latencies.values() for value in values]
+
+    report = {
+        "users": args.users,
+        "updates": updates,
+        "handle_seconds": round(handled_at - started, 3),
+        "total_seconds": round(finished_at - started, 3),
+        "updates_per_second": round(updates / (handled_at - started), 1),
+        "latency_ms": {
+            kind: {"p50": round(percentile(values, 0.5) * 1000, 2), "p99": round(percentile(values, 0.99) * 1000, 2)}
+            for kind, values in list(latencies.items()) + [("all", all_latencies)]
+        },
+        "api_calls": api_calls,
+        "api_calls_per_interaction": round(api_calls / interactions, 2),
+        "api_requests_by_method": dict(api.requests),
+        "api_throttled": dict(api.throttled),
+        "storage_flushes": flushes,
+        "storage_flush_seconds": round(flush_time, 3),
+        "storage_records_written_per_update": round(records_written / updates, 3) if updates else 0,
+        "errors": dict(errors),
+    }
+    return report
+
+
+def print_report(report):
+    print(f"\nПользователей: {report['users']}, обновлений: {report['updates']}")
+    print(f"Обработка: {report['handle_seconds']} с ({report['updates_per_second']} обновлений/с), "
+          f"с подарками и записью на диск: {report['total_seconds']} с")
+    print("Время обработки обновления, мс:")
+    for kind, values in report["latency_ms"].items():
+        print(f"  {kind:12} p50 {values['p50']:8}  p99 {values['p99']:8}")
+    print(f"Вызовов Bot API: {report['api_calls']} ({report['api_calls_per_interaction']} на действие)")
+    for method, count in sorted(report["api_requests_by_method"].items()):
+        throttled = report["api_throttled"].get(method, 0)
+        print(f"  {method:22} {count}" + (f" (429: {throttled})" if throttled else ""))
+    print(f"Хранилище: {report['storage_flushes']} сбросов за {report['storage_flush_seconds']} с, "
+          f"{report['storage_records_written_per_update']} записей на обновление")
+    if report["errors"]:
+        print("Ошибки:")
+        for error, count in report["errors"].items():
+            print(f"  {error}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота против поддельного Bot API")
+    parser.add_argument("--users", type=int, default=1000, help="сколько гостей")
+    parser.add_argument("--concurrency", type=int, default=100, help="обновлений в обработке одновременно")
+    parser.add_argument("--latency", type=float, default=30, help="задержка ответа Bot API, мс")
+    parser.add_argument("--throttle", type=float, default=0.0, help="доля ответов 429 (0..1)")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, с")
+    parser.add_argument("--gift-delay", type=float, default=0, help="пауза между этапами анимации подарка, с")
+    parser.add_argument("--backend", default="json", choices=("json", "journal", "sqlite"))
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    parser.add_argument("--serve-api", type=int, metavar="PORT", help="только поднять поддельный Bot API на порту")
+    args = parser.parse_args()
+
+    if args.serve_api:
+        api = FakeBotApi(latency=args.latency / 1000, throttle=args.throttle, retry_after=args.retry_after)
+        try:
+            asyncio.run(api.serve(args.serve_api))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    report = asyncio.run(run(args))
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
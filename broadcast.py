@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from pathlib import Path
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from outbound import BROADCAST, request_priority
+from storage import write_json_atomic
+
+log = logging.getLogger(__name__)
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду в один чат
+GLOBAL_RATE = 30
+PER_CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Ограничитель скорости: не больше rate разрешений в секунду"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Останавливает выдачу разрешений (например, после 429 с retry_after)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastReport:
+    def __init__(self, name):
+        self.name = name
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.skipped = 0  # уже обработаны до перезапуска
+
+    def __str__(self):
+        return (
+            f"Рассылка {self.name}: отправлено {self.sent}, ошибок {self.failed}, "
+            f"заблокировали бота {self.blocked}, пропущено (уже было) {self.skipped}"
+        )
+
+
+class Broadcaster:
+    """Массовая рассылка пулом отправителей под общим ограничителем скорости.
+
+    429 с retry_after ставит на паузу весь пул и возвращает сообщение в очередь,
+    сетевые и 5xx ошибки повторяются с экспоненциальной задержкой и джиттером.
+    Прогресс пишется в checkpoint_path, так что после перезапуска рассылка
+    с тем же именем продолжается с места остановки.
+    """
+
+    def __init__(self, bot, checkpoint_path, concurrency=8, max_attempts=5,
+                 rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL):
+        self.bot = bot
+        self.checkpoint_path = Path(checkpoint_path)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.per_chat_interval = per_chat_interval
+        self.bucket = TokenBucket(rate)
+        self._chat_next = {}
+        self._remaining = {}
+        # Файл общий для всех рассылок: записи идут по одной, каждая дочитывает чужой прогресс
+        self._checkpoint_lock = asyncio.Lock()
+
+    def pending(self):
+        """Сколько сообщений осталось отправить в каждой идущей рассылке"""
+        return dict(self._remaining)
+
+    # --- Контрольная точка ---
+
+    def _load_checkpoints(self):
+        if self.checkpoint_path.exists():
+            try:
+                with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError):
+                pass
+        return {}
+
+    def _write_checkpoint(self, name, entry):
+        checkpoints = self._load_checkpoints()
+        checkpoints[name] = entry
+        write_json_atomic(self.checkpoint_path, checkpoints)
+
+    async def _save_checkpoint(self, name, progress):
+        entry = {key: sorted(ids) if isinstance(ids, set) else ids
+                 for key, ids in progress.items()}
+        async with self._checkpoint_lock:
+            await asyncio.to_thread(self._write_checkpoint, name, entry)
+
+    # --- Рассылка ---
+
+    async def run(self, name, recipients, **send_kwargs):
+        """Отправляет сообщения recipients — список пар (chat_id, text)
+        или троек (chat_id, text, kwargs) со своими параметрами для получателя.
+
+        send_kwargs (например, reply_markup) передаются в каждый send_message.
+        """
+        report = BroadcastReport(name)
+        saved = self._load_checkpoints().get(name, {})
+        progress = {
+            "sent": set(saved.get("sent", [])),
+            "failed": set(saved.get("failed", [])),
+            "blocked": set(saved.get("blocked", [])),
+            "finished": False,
+        }
+        handled = progress["sent"] | progress["failed"] | progress["blocked"]
+
+        queue = asyncio.Queue()
+        for chat_id, text, *extra in recipients:
+            if chat_id in handled:
+                report.skipped += 1
+                continue
+            kwargs = {**send_kwargs, **extra[0]} if extra else send_kwargs
+            queue.put_nowait((chat_id, text, kwargs, 1))
+
+        remaining = self._remaining[name] = queue.qsize()
+        done = asyncio.Event()
+        if remaining == 0:
+            done.set()
+
+        def finish(chat_id, outcome):
+            nonlocal remaining
+            progress[outcome].add(chat_id)
+            setattr(report, outcome, getattr(report, outcome) + 1)
+            remaining -= 1
+            self._remaining[name] = remaining
+            if remaining == 0:
+                done.set()
+
+        def requeue(item, delay):
+            asyncio.get_running_loop().call_later(delay, queue.put_nowait, item)
+
+        async def worker():
+            # Рассылка уступает очередь ответам пользователям
+            request_priority.set(BROADCAST)
+            while True:
+                item = await queue.get()
+                try:
+                    await self._deliver(item, finish, requeue)
+                except Exception as e:
+                    log.warning("Ошибка рассылки %s для %s: %s", name, item[0], e)
+                    finish(item[0], "failed")
+
+        stopped = asyncio.Event()
+
+        async def checkpointer():
+            # Пишем прогресс раз в секунду, а не на каждое сообщение.
+            # Не отменяем, а останавливаем: отмена не прерывает запись в потоке,
+            # и финальное сохранение столкнулось бы с ней на том же .tmp
+            while not stopped.is_set():
+                try:
+                    await asyncio.wait_for(stopped.wait(), 1)
+                except asyncio.TimeoutError:
+                    await self._save_checkpoint(name, progress)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        saver = asyncio.create_task(checkpointer())
+        try:
+            await done.wait()
+            progress["finished"] = True
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            stopped.set()
+            await asyncio.gather(saver, return_exceptions=True)
+            self._remaining.pop(name, None)
+            await self._save_checkpoint(name, progress)
+        return report
+
+    async def _wait_for_chat(self, chat_id):
+        now = time.monotonic()
+        ready_at = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, ready_at) + self.per_chat_interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    async def _deliver(self, item, finish, requeue):
+        chat_id, text, send_kwargs, attempt = item
+        await self._wait_for_chat(chat_id)
+        await self.bucket.acquire()
+        try:
+            await self.bot.send_message(chat_id, text, **send_kwargs)
+        except TelegramRetryAfter as e:
+            # Telegram сам сказал, сколько ждать: тормозим весь пул, сообщение — обратно в очередь
+            self.bucket.pause(e.retry_after)
+            requeue((chat_id, text, send_kwargs, attempt), e.retry_after)
+        except TelegramForbiddenError:
+            finish(chat_id, "blocked")
+        except TelegramBadRequest:
+            finish(chat_id, "failed")
+        except (TelegramNetworkError, TelegramServerError):
+            if attempt >= self.max_attempts:
+                finish(chat_id, "failed")
+                return
+            delay = min(30, 2 ** attempt) * random.uniform(0.5, 1.5)
+            requeue((chat_id, text, send_kwargs, attempt + 1), delay)
+        else:
+            finish(chat_id, "sent")
@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+from aiogram.exceptions import TelegramBadRequest
+
+# Готовая информационная карточка: собирается один раз и дальше не меняется
+InfoCard = namedtuple("InfoCard", "name text reply_markup parse_mode", defaults=(None, None))
+
+
+class CardTracker:
+    """Показывает карточки, редактируя уже отправленные, а не удаляя и присылая заново.
+
+    Какая карточка и в каком сообщении показана пользователю, хранится только
+    в памяти. Повторный показ той же карточки ничего не отправляет, изменённой —
+    один editMessageText. Новое сообщение уходит, только если прежнего нет
+    (например, после перезапуска) или его уже нельзя отредактировать.
+    Если ту же карточку просят ещё раз, хотя о ней уже напомнили, — возможно,
+    пользователь её удалил: проверяем правкой и при «not found» шлём заново.
+    """
+
+    UNCHANGED = "unchanged"
+    EDITED = "edited"
+    SENT = "sent"
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._shown = {}
+
+    async def show(self, message, card):
+        key = (message.chat.id, card.name)
+        shown = self._shown.get(key)
+        if shown is not None:
+            message_id, shown_card, reminded = shown
+            if shown_card == card and not reminded:
+                self._shown[key] = (message_id, card, True)
+                return self.UNCHANGED
+            try:
+                await self.bot.edit_message_text(
+                    text=card.text, chat_id=message.chat.id, message_id=message_id,
+                    parse_mode=card.parse_mode, reply_markup=card.reply_markup,
+                )
+                self._shown[key] = (message_id, card, False)
+                return self.EDITED
+            except TelegramBadRequest as e:
+                if "not modified" in e.message:
+                    self._shown[key] = (message_id, card, True)
+                    return self.UNCHANGED
+                # Сообщение удалено или слишком старое — отправим новое
+
+        sent = await message.answer(card.text, parse_mode=card.parse_mode, reply_markup=card.reply_markup)
+        self._shown[key] = (sent.message_id, card, False)
+        return self.SENT
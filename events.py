@@ -0,0 +1,173 @@
+import datetime
+import json
+import re
+from pathlib import Path
+
+from cards import InfoCard
+from router import pack_callback
+from storage import ParticipantStore, make_backend
+from templates import Template, bind_texts, keyboard, localized
+
+# id мероприятия попадает в callback_data и deep-link /start <id>, поэтому короткий и без спецсимволов
+EVENT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+# Поля, которые подставляются для каждого пользователя; остальные — при загрузке
+USER_FIELDS = frozenset({"name", "first_name"})
+
+# Текстовые поля настроек: язык гостю предлагаем, только если все они на нём есть
+LOCALIZED_FIELDS = ("title", "date_text", "address", "welcome", "info")
+
+
+class EventView:
+    """Мероприятие на одном языке: тексты с уже подставленными полями мероприятия,
+    карточки и клавиатуры. Собирается один раз при загрузке, дальше только читается.
+    """
+
+    def __init__(self, event, locale, texts):
+        default = event.catalog.default
+        values = {
+            name: localized(event.config.get(name, getattr(event, name)), locale, default)
+            for name in ("title", "date_text", "time_text", "address")
+        }
+        welcome = localized(event.config.get("welcome"), locale, default)
+        values["welcome"] = welcome or texts["default_welcome"].bind(title=values["title"])
+        info = localized(event.config.get("info"), locale, default) or values["title"]
+        self.locale = locale
+        self.texts = bind_texts(texts, **values)
+        self.reminders = {
+            kind: bind_texts(self.texts["reminder"], **parts)
+            for kind, parts in self.texts["reminder_kinds"].items()
+        }
+        # "reminder" — заготовка для reminders, её поля greeting и subject уже подставлены там
+        _check_fields(f"{event.id}/{locale}", {**self.texts, "reminder": None, "reminder_kinds": self.reminders})
+
+        self.time_card = InfoCard(
+            name=f"time_info:{event.id}",
+            text=self.texts["time_card"],
+            reply_markup=keyboard([[(self.texts["button_map"], {"url": event.map_link})]]) if event.map_link else None,
+            parse_mode="Markdown",
+        )
+        self.info_card = InfoCard(name=f"bot_info:{event.id}", text=info)
+        self.menu_markup = keyboard([
+            [(self.texts["button_gift"], event.callback("gift_button"))],
+            [(self.texts["button_time"], event.callback("time_info"))],
+            [(self.texts["button_info"], event.callback("bot_info"))],
+        ])
+        self.rsvp_markup = keyboard([
+            [(self.texts["button_will_come"], event.callback("will_come")),
+             (self.texts["button_will_not_come"], event.callback("will_not_come"))],
+        ])
+        self.change_markup = keyboard([[(self.texts["button_change"], event.callback("change_decision"))]])
+
+    def __getitem__(self, key):
+        """Готовая строка, кортеж строк или шаблон с полями пользователя (render(...))"""
+        return self.texts[key]
+
+
+def _check_fields(where, value, key=""):
+    # Опечатка в имени поля всплывёт при запуске, а не KeyError в обработчике
+    if isinstance(value, Template) and value.fields - USER_FIELDS:
+        raise ValueError(f"{where}: {key} — неизвестные поля {sorted(value.fields - USER_FIELDS)}")
+    if isinstance(value, tuple):
+        for item in value:
+            _check_fields(where, item, key)
+    elif isinstance(value, dict):
+        for name, item in value.items():
+            _check_fields(where, item, f"{key}.{name}" if key else name)
+
+
+class Event:
+    """Мероприятие: свои настройки, свой шард участников и готовые тексты,
+    карточки и клавиатуры на каждом языке (view(language_code)).
+
+    Текстовые поля настроек ("title", "welcome", "info" и т.п.) можно задать
+    строкой (язык по умолчанию) или словарём по языкам. Если на языке гостя
+    описаны не все они, мероприятие показывается ему целиком на языке по
+    умолчанию — без английских кнопок вокруг русской карточки.
+    В callback_data кнопок зашит id мероприятия, так что ответы попадают в нужный шард.
+    """
+
+    def __init__(self, event_id, config, store, catalog):
+        self.id = event_id
+        self.store = store
+        self.config = config
+        self.catalog = catalog
+        default = catalog.default
+        self.title = localized(config["title"], default, default)
+        self.starts_at = datetime.datetime.fromisoformat(config["starts_at"])
+        self.date_text = localized(config["date_text"], default, default)
+        self.time_text = localized(config.get("time_text", f"{self.starts_at:%H:%M}"), default, default)
+        self.address = localized(config["address"], default, default)
+        self.map_link = config.get("map_link")
+        # [{"at": "2025-12-05T12:00:00", "kind": "day_before"}, ...]
+        self.reminders = config.get("reminders", [])
+        self.views = {
+            locale: EventView(self, locale, texts)
+            for locale, texts in catalog.locales.items()
+            if locale == default or self._localized_for(locale)
+        }
+
+    def _localized_for(self, locale):
+        return all(
+            isinstance(self.config[name], dict) and locale in self.config[name]
+            for name in LOCALIZED_FIELDS if name in self.config
+        )
+
+    def view(self, language_code=None):
+        return self.views.get(self.catalog.locale(language_code)) or self.views[self.catalog.default]
+
+    def callback(self, action, *args):
+        """callback_data кнопки этого мероприятия: id идёт последним аргументом"""
+        return pack_callback(action, *args, self.id)
+
+    def __str__(self):
+        return f"{self.id} — {self.title}, {self.date_text}"
+
+
+class EventRegistry:
+    """Мероприятия из events.json, у каждого — свой файл участников.
+
+    Шард по умолчанию — DATA_DIR/participants-<id>.json (или "shard" из
+    настроек). Служебные данные бота (задания, реестр медиа) живут в шарде
+    мероприятия по умолчанию.
+    """
+
+    def __init__(self, config_path, data_dir, catalog, backend_kind="json", shared=False):
+        self.config_path = Path(config_path)
+        self.catalog = catalog
+        self.data_dir = Path(data_dir)
+        self.backend_kind = backend_kind
+        self.shared = shared
+        self._events = {}
+        self.default = None
+
+    def load(self):
+        with open(self.config_path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        for event_id, config in raw["events"].items():
+            if not EVENT_ID_RE.match(event_id):
+                raise ValueError(f"{self.config_path.name}: недопустимый id мероприятия {event_id!r}")
+            shard = self.data_dir / config.get("shard", f"participants-{event_id}.json")
+            store = ParticipantStore(make_backend(self.backend_kind, shard, shared=self.shared))
+            store.load()
+            self._events[event_id] = Event(event_id, config, store, self.catalog)
+        default_id = raw.get("default") or next(iter(self._events))
+        if default_id not in self._events:
+            raise ValueError(f"{self.config_path.name}: мероприятие по умолчанию {default_id!r} не описано")
+        self.default = self._events[default_id]
+
+    def get(self, event_id=None):
+        """Мероприятие по id; без id — мероприятие по умолчанию (старые кнопки), неизвестный id — None"""
+        if not event_id:
+            return self.default
+        return self._events.get(event_id)
+
+    def __iter__(self):
+        return iter(self._events.values())
+
+    def __len__(self):
+        return len(self._events)
+
+    async def close(self):
+        for event in self._events.values():
+            await event.store.close()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import signal
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+# Ключ в служебных данных хранилища: до какого обновления всё обработано
+STATE_META_KEY = "lifecycle"
+
+# Telegram хранит неподтверждённые обновления сутки — более старый снимок для отсева не годится
+REDELIVERY_WINDOW = 24 * 3600
+
+# Сколько последних обработанных update_id помнить для снимка
+FINISHED_WINDOW = 10000
+
+
+class Lifecycle:
+    """Остановка без потерь и быстрый перезапуск.
+
+    По SIGTERM/SIGINT main() перестаёт принимать обновления, drain() ждёт
+    обработчики и фоновые задачи (анимации подарков) не дольше drain_timeout
+    секунд и отменяет оставшиеся, save() записывает в хранилище компактный
+    снимок {"offset", "done", "saved_at"}: всё ниже offset обработано,
+    done — обработанные выше него.
+
+    getUpdates Telegram подтверждает только следующим запросом, поэтому
+    после перезапуска он присылает последние обновления ещё раз. Экземпляр
+    подключается первым outer-middleware на dp.update и по снимку пропускает
+    уже обработанные; брошенные при остановке приходят снова и обрабатываются.
+    Повтор webhook (Telegram или роутер воркеров не дождались ответа)
+    отсеивается всегда: по идущим обработкам и последним FINISHED_WINDOW
+    завершённым.
+    """
+
+    def __init__(self, store, key=STATE_META_KEY, drain_timeout=10.0):
+        self.store = store
+        self.key = key
+        self.drain_timeout = drain_timeout
+        state = store.get_meta(key) or {}
+        self._offset = state.get("offset", 0)
+        self._finished = deque(state.get("done", []), maxlen=FINISHED_WINDOW)
+        self._done = set(self._finished)
+        self._last = self._offset - 1
+        # Отсеиваем повторы, только пока не пришло заведомо новое обновление
+        fresh = time.time() - state.get("saved_at", 0) < REDELIVERY_WINDOW
+        self._replay_until = max(self._done, default=self._offset - 1) if fresh else -1
+        self._inflight = {}
+        self._abandoned = set()
+        self._drained = set()
+        self._background = set()
+        self._stop = asyncio.Event()
+        self._deadline = None
+        self.skipped = 0
+
+    # --- Обновления ---
+
+    async def __call__(self, handler, update, data):
+        update_id = update.update_id
+        if update_id > self._replay_until:
+            self._replay_until = -1
+        if (update_id in self._inflight or update_id in self._done
+                or update_id <= self._replay_until and update_id < self._offset):
+            self.skipped += 1
+            REGISTRY.inc("updates_redelivered")
+            return None
+        self._inflight[update_id] = asyncio.current_task()
+        try:
+            return await handler(update, data)
+        except asyncio.CancelledError:
+            # Брошено при остановке — после перезапуска Telegram пришлёт его снова
+            self._abandoned.add(update_id)
+            raise
+        finally:
+            self._inflight.pop(update_id, None)
+            if update_id not in self._abandoned:
+                self._remember(update_id)
+                self._last = max(self._last, update_id)
+
+    def _remember(self, update_id):
+        if len(self._finished) == self._finished.maxlen:
+            self._done.discard(self._finished[0])
+        self._finished.append(update_id)
+        self._done.add(update_id)
+
+    def inflight(self):
+        return len(self._inflight)
+
+    # --- Задачи ---
+
+    def track(self, task):
+        """Задача, которую при остановке дожидаемся (в пределах drain_timeout)"""
+        self._drained.add(task)
+        task.add_done_callback(self._drained.discard)
+        return task
+
+    def background(self, task):
+        """Бесконечная фоновая задача: при остановке просто отменяется"""
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    # --- Остановка ---
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_stop)
+            except NotImplementedError:  # Windows: остаётся KeyboardInterrupt
+                pass
+
+    def request_stop(self):
+        if not self._stop.is_set():
+            log.info("Получен сигнал остановки, завершаю обработку")
+            self._deadline = time.monotonic() + self.drain_timeout
+            self._stop.set()
+
+    async def wait(self, intake):
+        """Ждёт сигнала остановки; если приём обновлений завершился сам — пробрасывает его ошибку"""
+        stop = asyncio.create_task(self._stop.wait())
+        try:
+            await asyncio.wait({intake, stop}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop.cancel()
+        if intake.done():
+            intake.result()
+
+    def remaining(self):
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.drain_timeout
+        return max(0.0, self._deadline - time.monotonic())
+
+    async def drain(self):
+        """Дожидается обработчиков и отслеживаемых задач до дедлайна, остальные отменяет"""
+        pending = set(self._inflight.values()) | self._drained
+        pending.discard(asyncio.current_task())
+        if pending:
+            _, pending = await asyncio.wait(pending, timeout=self.remaining())
+        if pending:
+            log.warning("Не успели завершиться за %s с: %d задач, отменяю", self.drain_timeout, len(pending))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+
+    def save(self):
+        pending = set(self._inflight) | self._abandoned
+        offset = min(pending) if pending else max(self._offset, self._last + 1)
+        done = sorted({update_id for update_id in self._finished if update_id > offset})
+        self.store.set_meta(self.key, {"offset": offset, "done": done, "saved_at": time.time()})
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+log = logging.getLogger(__name__)
+
+
+class FileLock:
+    """Межпроцессная advisory-блокировка на файле.
+
+    Блокировку держит открытый файл: если процесс упал, ОС снимает её сама,
+    поэтому «зависших» блокировок после аварии не бывает.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd = None
+
+    def acquire(self):
+        """Пытается взять блокировку, не дожидаясь. True — взяли"""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        # Для диагностики: кто держит блокировку
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        os.close(self._fd)
+        self._fd = None
+
+
+class LeaderElection:
+    """Выбор ведущего среди воркеров: ведущий — тот, кто держит блокировку файла.
+
+    Остальные раз в retry секунд пробуют её взять, так что при падении
+    ведущего его место занимает другой воркер. Пока блокировка у нас,
+    работает on_elected() (планировщик и прочие задачи «в одном экземпляре»).
+    """
+
+    def __init__(self, lock_path, retry=5.0):
+        self.lock = FileLock(lock_path)
+        self.retry = retry
+
+    async def run(self, on_elected):
+        try:
+            while not self.lock.acquire():
+                await asyncio.sleep(self.retry)
+            log.info("Процесс %d — ведущий: запускаю планировщик", os.getpid())
+            await on_elected()
+        finally:
+            self.lock.release()
@@ -0,0 +1,261 @@
+"""Журнал в JSON lines без блокировки event loop и трассировка обновлений.
+
+Записи из любых потоков кладутся в очередь (QueueHandler), а форматирует
+их в JSON и пишет в stdout или файл отдельный поток (QueueListener).
+
+У каждого обновления своя трасса (TraceMiddleware): её id попадает во все
+записи, сделанные во время обработки, в том числе из задач, запущенных
+обработчиком (анимация подарка) — contextvars копируются в create_task и
+to_thread. Внутри трассы span() замеряет вызовы Bot API и хранилища.
+Спаны копятся в памяти и пишутся, только если трасса попала в выборку
+(sample_rate), оказалась медленной (slow_ms) или завершилась ошибкой —
+так медленное нажатие видно целиком, а обычный поток не засоряет журнал.
+"""
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+
+
+log = logging.getLogger("trace")
+
+# Текущая трасса; задачи и потоки, запущенные из обработчика, наследуют её
+_current = contextvars.ContextVar("trace", default=None)
+
+# Доля трасс, которые пишутся целиком, и порог «медленной» трассы или спана
+SAMPLE_RATE = 0.01
+SLOW_SECONDS = 0.5
+
+# Больше спанов на трассу не копим (рассылка — тысячи вызовов API)
+MAX_SPANS = 200
+
+# Под перегрузкой медленные все трассы — целиком пишем не больше стольких в секунду;
+# из того же бюджета — медленные спаны вне трассы и после её закрытия
+SLOW_TRACES_PER_SECOND = 10
+_slow_window = [0, 0]
+
+
+def _slow_allowed():
+    second = int(time.monotonic())
+    if _slow_window[0] != second:
+        _slow_window[:] = [second, 0]
+    _slow_window[1] += 1
+    return _slow_window[1] <= SLOW_TRACES_PER_SECOND
+
+
+class Trace:
+    __slots__ = ("id", "sampled", "spans", "dropped", "closed", "kept")
+
+    def __init__(self, trace_id, sampled):
+        self.id = trace_id
+        self.sampled = sampled
+        self.spans = []
+        self.dropped = 0
+        self.closed = False
+        self.kept = False
+
+    def add(self, name, started, duration, error, fields):
+        if not self.closed:
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append((name, started, duration, error, fields))
+            else:
+                self.dropped += 1
+        elif self.kept or _worth_emitting(error, duration):
+            # Трасса уже закрыта, а фоновая задача из неё ещё работает
+            _emit(self.id, name, duration, error, fields, _level(error, duration))
+
+    def finish(self, name, started, duration, error, fields):
+        self.kept = self.sampled or error is not None or any(span[3] is not None for span in self.spans) or (
+            duration >= SLOW_SECONDS and _slow_allowed())
+        self.closed = True
+        if self.kept:
+            # Вся трасса — одним уровнем, чтобы LOG_LEVEL не отрезал её часть
+            level = _level(error, duration)
+            for span_name, span_started, span_duration, span_error, span_fields in self.spans:
+                _emit(self.id, span_name, span_duration, span_error,
+                      {"at_ms": round((span_started - started) * 1000, 1), **span_fields}, level)
+            if self.dropped:
+                fields = {**fields, "spans_dropped": self.dropped}
+            _emit(self.id, name, duration, error, fields, level, root=True)
+        self.spans = []
+
+
+def _worth_emitting(error, duration):
+    """Отдельный спан без записанной трассы: ошибка или медленный в пределах бюджета"""
+    return error is not None or (duration >= SLOW_SECONDS and _slow_allowed())
+
+
+def _level(error, duration):
+    return logging.WARNING if error is not None or duration >= SLOW_SECONDS else logging.INFO
+
+
+def _emit(trace_id, name, duration, error, fields, level, root=False):
+    entry = {"span": name, "ms": round(duration * 1000, 1), **fields}
+    if error is not None:
+        entry["error"] = error
+    log.log(level, "trace" if root else "span", extra={"trace_id": trace_id, "fields": entry})
+
+
+def current_trace_id():
+    trace_ = _current.get()
+    return trace_.id if trace_ is not None else None
+
+
+@contextmanager
+def trace(name, trace_id, **fields):
+    """Корень трассы: обработка обновления, задание планировщика"""
+    current = Trace(trace_id, random.random() < SAMPLE_RATE)
+    token = _current.set(current)
+    started = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        current.finish(name, started, time.perf_counter() - started, error, fields)
+
+
+@contextmanager
+def span(name, **fields):
+    """Замер участка внутри трассы; вне трассы пишется, только если медленный, с ошибкой или попал в выборку"""
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        current = _current.get()
+        if current is not None:
+            current.add(name, started, duration, error, fields)
+        elif _worth_emitting(error, duration) or random.random() < SAMPLE_RATE:
+            _emit(None, name, duration, error, fields, _level(error, duration))
+
+
+class TraceMiddleware(BaseMiddleware):
+    """Трасса на каждое обновление (outer-middleware на dp.update); labels — metrics.HandlerLabels"""
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    async def __call__(self, handler, update, data):
+        event = update.event
+        user = getattr(event, "from_user", None)
+        with trace("update", f"u{update.update_id}", handler=self.labels(event),
+                   user=user.id if user else None):
+            return await handler(update, data)
+
+
+class ApiTraceMiddleware(BaseRequestMiddleware):
+    """Спан на каждый вызов Bot API — вместе с ожиданием в очереди исходящих"""
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, GetUpdates):
+            # Долгий запрос поллинга — «медленный» всегда, спан ничего не скажет
+            return await make_request(bot, method)
+        with span("api", method=type(method).__name__):
+            return await make_request(bot, method)
+
+
+# --- Вывод ---
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace"] = record.trace_id
+        entry.update(getattr(record, "fields", None) or {})
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Предупреждения и ошибки из одного места кода — не больше burst за interval секунд.
+
+    Сколько записей пропущено, видно в поле suppressed первой записи следующего окна.
+    """
+
+    def __init__(self, burst=5, interval=60.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or record.name == log.name:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            if window is not None and window[2]:
+                record.suppressed = window[2]
+            self._windows[key] = [now, 1, 0]
+            return True
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """В потоке вызова — только подстановка аргументов, трасса и текст исключения; JSON — в потоке записи"""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if not hasattr(record, "trace_id"):
+            record.trace_id = current_trace_id()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level="INFO", path=None, sample_rate=SAMPLE_RATE, slow_ms=SLOW_SECONDS * 1000):
+    """Направляет все логгеры в очередь; поток записи дописывает её при выходе из процесса"""
+    global SAMPLE_RATE, SLOW_SECONDS
+    SAMPLE_RATE = sample_rate
+    SLOW_SECONDS = slow_ms / 1000
+
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(RateLimitFilter())
+    target = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stdout)
+    target.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(records, target)
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    # aiogram пишет строку на каждое обновление — её заменяет трасса
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
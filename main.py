@@ -1,592 +1,838 @@
-import asyncio
-from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from dotenv import load_dotenv
-import os
-import json
-import datetime
-import random
-from pathlib import Path
-
-# Загружаем .env
-load_dotenv()
-
-# Получаем токен из переменной окружения
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-
-if not BOT_TOKEN:
-    raise ValueError("Токен бота не найден в файле .env")
-
-# ПРАВИЛЬНЫЙ ПУТЬ к файлу участников
-BASE_DIR = Path(__file__).parent
-PARTICIPANTS_FILE = BASE_DIR / "participants.json"
-
-# Загружаем список участников при запуске
-def load_participants():
-    if PARTICIPANTS_FILE.exists():
-        with open(PARTICIPANTS_FILE, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-            if content:  # Если файл не пустой
-                try:
-                    return json.loads(content)
-                except json.JSONDecodeError:
-                    return []  # Если ошибка — возвращаем пустой список
-    return []
-
-async def main():
-    print(f"Рабочая директория: {os.getcwd()}")
-    print(f"Файл участников: {PARTICIPANTS_FILE.absolute()}")
-    print(f"Файл существует: {PARTICIPANTS_FILE.exists()}")
-
-    asyncio.create_task(check_and_send_reminder())
-    await dp.start_polling(bot)
-	
-# Сохраняем участника по username (если username нет — по first_name, но это менее надёжно)
-def save_participant(user_data):
-    participants = load_participants()
-    user_id = user_data.get("user_id")
-    if user_id is None:
-        return
-
-    for i, p in enumerate(participants):
-        if p.get("user_id") == user_id:
-            # Обновляем только указанные поля, остальное сохраняем
-            p.update(user_data)
-            participants[i] = p
-            break
-    else:
-        participants.append(user_data)
-
-    with open(PARTICIPANTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(participants, f, ensure_ascii=False, indent=2)
-
-async def send_media_and_message(message_obj, user_data):
-    """Отправляет стикер/GIF/аудио и сообщение из user_data"""
-    # Аудио
-    if "audio" in user_data and user_data["audio"]:
-        try:
-            await message_obj.answer_audio(audio=user_data["audio"], caption="🎵 Включи меня!")
-            await asyncio.sleep(2)
-        except Exception:
-            pass
-    elif "audio_file_id" in user_data and user_data["audio_file_id"]:
-        try:
-            await message_obj.answer_audio(audio=user_data["audio_file_id"], caption="🎵 Включи меня!")
-            await asyncio.sleep(2)
-        except Exception:
-            pass
-
-    # Стикер
-    if "sticker" in user_data and user_data["sticker"]:
-        try:
-            await message_obj.answer_sticker(sticker=user_data["sticker"])
-            await asyncio.sleep(1)
-        except Exception:
-            pass
-
-    # GIF
-    if "gif" in user_data and user_data["gif"]:
-        try:
-            await message_obj.answer_animation(animation=user_data["gif"])
-            await asyncio.sleep(1)
-        except Exception:
-            pass
-
-    # Сообщение
-    await message_obj.answer(user_data["message"])
-    
-# Инициализируем бота и диспетчер
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
-
-# Обработчик добавления .mp3
-@dp.message(lambda m: m.audio)
-async def get_audio_id(message: types.Message):
-    print("MP3 file_id:", message.audio.file_id)
-    
-# Для получения file_id стикера
-@dp.message(lambda m: m.sticker)
-async def get_sticker_id(message: types.Message):
-    print("Sticker file_id:", message.sticker.file_id)
-
-# Для получения file_id GIF
-@dp.message(lambda m: m.animation)
-async def get_gif_id(message: types.Message):
-    print("GIF file_id:", message.animation.file_id)
-    
-# Обработчик команды /start
-@dp.message(Command("start"))
-async def send_welcome(message: types.Message):
-    # Создаём INLINE-кнопку
-    keyboard = [
-        [types.InlineKeyboardButton(text="🎁 Подумать о подарке", callback_data="gift_button")],
-        [types.InlineKeyboardButton(text="🕒 Место и время", callback_data="time_info")],
-        [types.InlineKeyboardButton(text="ℹ️ Информация", callback_data="bot_info")]
-    ]
-    reply_markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-    await message.answer(
-        "Привет! Я помогу тебе подготовиться к празднику для старичка 🎉\n\n"
-        "Выбери, что тебя интересует:",
-        reply_markup=reply_markup
-    )
-
-# Inline-кнопка "Место и время"
-@dp.callback_query(lambda call: call.data == "time_info")
-async def handle_time_info(call: types.CallbackQuery):
-    user_id = call.from_user.id
-    await call.answer()
-
-    # Загружаем данные пользователя
-    participants = load_participants()
-    user_data = next((p for p in participants if p.get("user_id") == user_id), None)
-
-    # Если есть старое сообщение — удаляем
-    if user_data and "time_info_msg_id" in user_data:
-        try:
-            await bot.delete_message(chat_id=user_id, message_id=user_data["time_info_msg_id"])
-        except Exception:
-            pass  # Игнорируем ошибку, если сообщение уже удалено
-
-    # Отправляем новое сообщение
-    address = "г. Рязань, ул. Пугачева, д. 10, кв. 18"
-    time = "6 декабря 2025 года в 19:00"
-    map_link = "https://yandex.ru/maps/-/CLS15OOK"
-
-    keyboard = [[types.InlineKeyboardButton(text="📍 Показать на карте", url=map_link)]]
-    reply_markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-    text = f"📍 **Место**: {address}\n🕗 **Время**: {time}"
-    sent_msg = await call.message.answer(text, parse_mode="Markdown", reply_markup=reply_markup)
-
-    # Сохраняем message_id
-    if user_data is None:
-        user_data = {"user_id": user_id}
-    user_data["time_info_msg_id"] = sent_msg.message_id
-    save_participant(user_data)
-
-# Inline-кнопка "Информация"
-@dp.callback_query(lambda call: call.data == "bot_info")
-async def handle_bot_info(call: types.CallbackQuery):
-    user_id = call.from_user.id
-    await call.answer()
-
-    participants = load_participants()
-    user_data = next((p for p in participants if p.get("user_id") == user_id), None)
-
-    # Удаляем старое сообщение
-    if user_data and "bot_info_msg_id" in user_data:
-        try:
-            await bot.delete_message(chat_id=user_id, message_id=user_data["bot_info_msg_id"])
-        except Exception:
-            pass
-
-    # Отправляем новое
-    text = (
-        "Бот-помощник в организации туц-туц у Егорки 6 декабря 2025 года. ✅\n\n"
-        "Что вам потребуется на данном мероприятии 👇\n"
-        "🟢 Хорошо выспаться перед этим\n"
-        "🟢 Зарядиться отличным настроением\n"
-        "🟡 Машину лучше оставить дома🍺🍻\n"
-        "🙏 У кого есть небольшие складные стулья, возьмите пожалуйста с собой🫶\n\n\n"
-        "oldmanbirthday_bot v.1.0.1\n"
-        "Для связи с создателем: @qdlopoelp"
-    )
-    sent_msg = await call.message.answer(text)
-
-    # Сохраняем message_id
-    if user_data is None:
-        user_data = {"user_id": user_id}
-    user_data["bot_info_msg_id"] = sent_msg.message_id
-    save_participant(user_data)
-
-# Команда /time
-#@dp.message(Command("time"))
-#async def cmd_time(message: types.Message):
-#    await send_time_info(message)
-
-# Команда /info
-#@dp.message(Command("info"))
-#async def cmd_info(message: types.Message):
-#    await send_bot_info(message)
-    
-    # База по user_id:
-SPECIAL_USERS_BY_ID = {
-    "518928394": {
-        "message": "Я покопался в мыслях у Егорки, и они таковы...\n Он будет очень сильно рад видеть вас с Саней на своем туц-туц, сильно вас ждет,\n и вообще вы красавцы!❤️\n P.S. Если сможете, возьмите стул(стулья)\n",
-        "sticker": "CAACAgIAAxkBAAIClGkjlxThozzwRkYEh-jCZjEBVQjjAAKoAANXTxUINnLvCwfl94k2BA",
-        "audio": "CQACAgIAAxkBAAICgGkjh0KsyEi4AAG292Hi8vAqY_HbnAAC6JcAAi3dGEmwA0s4DmlLwjYE"
-    },
-    "1606619739": {
-        "message": "Анастасия Игоревна, добрейшего вам времени суток!\n Это я сейчас залез в мысли к Егору🤔\n Странно, почему он с тобой на вы... Ну да ладно, возвращаемся к подарку...\n Его заветное желание, чтобы вы пришли на его праздник и от души повеселились, это все, что он хочет🥳\n",
-        "sticker": "CAACAgIAAxkBAAIBFmki36Ce5yk3UR-OKI_NbDrByuTiAAIsAQAC9wLID6abwCn6K4ldNgQ",
-        "audio": "CQACAgIAAxkBAAICfmkjhxfmjEeXoNTIHYKc5EJW2TqtAALmlwACLd0YSTkUVZ9eoCEKNgQ"
-    },
-    "1204015793": {
-        "message": "Я подключился к мыслям старого, все проанализировал\n и в отношении вас, Сергей, там особая цель:\n Вам надо почему-то тусить за двоих🤔, это самое главное желание именинника🥳",
-        "sticker": "CAACAgIAAxkBAAIBE2ki32fa1zZsz_DJGDQhV6BJLQbCAAKzCwACKlBRSiyjtgnsadPWNgQ",
-        "audio": "CQACAgIAAxkBAAICgGkjh0KsyEi4AAG292Hi8vAqY_HbnAAC6JcAAi3dGEmwA0s4DmlLwjYE"
-    },
-    "1350663194": {
-        "message": "Аня, покопавшись в мыслях Егорки, он очень сильно ждет вас с Миханом,\n это его заветное желание, так что надо натуситься от души😊\n\n P.S. Мясца поесть...😋\n",
-        "sticker": "CAACAgIAAxkBAAIClWkjl-sr1Sx3gz4K47KQaxNmwYp1AAKrAANXTxUI40m-ezFiQsk2BA",
-        "audio": "CQACAgIAAxkBAAICgGkjh0KsyEi4AAG292Hi8vAqY_HbnAAC6JcAAi3dGEmwA0s4DmlLwjYE"
-    }
-}
-# Индивидуальные данные для особых пользователей
-SPECIAL_USERS = {
-    "wa_what": {
-        "message": "Ася, я преместился в мысли именинника, вот что нашел у него в голове:\n Он очень соскучился и желает, чтобы ты схватила за руку Диму и вы в отличном настроении приехали к нему на праздник.\n P.S. у меня нет возможности подключаться к мыслям других людей, но что-то мне подсказывает, что по вам все очень соскучились 🥰",
-        "sticker": "CAACAgIAAxkBAAIBF2ki4A-ahIdjkcmLttZW96J5Z-llAALTRgACH0tZSNhPyifcQcRnNgQ",  # замени на реальный file_id
-        "audio_file_id": "CQACAgIAAxkBAAICfmkjhxfmjEeXoNTIHYKc5EJW2TqtAALmlwACLd0YSTkUVZ9eoCEKNgQ"
-    },
-    "Laisteer": {
-        "message": "Братааааааааан!\n Вот такие мысли были у именинника, когда я залез к нему в мысли 💡.\n Ну он думает, что ты и так все знаешь, Аню подмышку хватаешь и приезжаете тусить 🥳",
-        "sticker": "CgACAgQAAxkBAAIBGWki4FMy-SkzI2bWpgqZRmXGtdFoAAJ_BAACKjTNUv8rzrUQbw7rNgQ",  # замени на реальный file_id
-        "audio_file_id": "CQACAgIAAxkBAAPUaSIxQ59X2NkfYnIsjP5hNoErW7kAAhaRAAIt3RBJwGOBwOC_tcE2BA" #WAZZZZZZZUP
-    },
-    "suffocatesand": {
-        "message": "СААААААААНЯ!\n Я залез к имениннику в голову и это первая его мысль 😁.\n Он думает тебе ничего не надо говорить, ты и так все знаешь, от души душевно в душу приезжайте с Женькой и тусите до утра. \n\n P.S. Можно взять с собой настойку и (или) стулья, если смогете 😉",
-        "gif": "CgACAgQAAxkBAAIBXWki-Z0-oOGCKnMqL4hzweCZlsVTAALxBgACziclU7qQ2z66TCvFNgQ",  # замени на реальный file_id
-        "audio_file_id": "CQACAgIAAxkBAAICgGkjh0KsyEi4AAG292Hi8vAqY_HbnAAC6JcAAi3dGEmwA0s4DmlLwjYE" #Сидр
-    },
-    "tamonikova": {
-        "message": "Ритулькаааааааа!\n Это я залез в мысли к имениннику и это было в его голове 😁.\n К тебе у него есть важное пожелание, сейчас попробую перевести: тыц-тыц, дрыц-тыц, да-бум-тссс.\n Понимать бы еще что это значит...🤔\n Наверное он хочет, чтобы ты тусила от души 🤠 ",
-        "sticker": "CAACAgIAAxkBAAIBGGki4Dc_p6rNax7w9awr0MHtXxk4AALRJQACN3uwSmqrpV8zXhDiNgQ",  # замени на реальный file_id
-        "audio_file_id": "CQACAgIAAxkBAAICe2kjhnaWtnum5X4eKivlQpGZOovjAALglwACLd0YSVpEkBc7Wp-UNgQ"
-    },
-    "myfaceistired": {
-        "message": "Сейчас я подключусь к мыслям Егорки...\n Димка!\n Ты ответил, что пока не уверен, что сможешь прийти, поэтому самое его заветное желание, чтобы ты оказался на его празднике.\n P.S. Желательно без машины 😉",
-        "sticker": "CAACAgIAAxkBAAIBFGki33a60fGGCERqr4u_41ZVr3ILAAIuAQAC9wLIDz2WPqTCJacaNgQ",  # замени на реальный file_id
-        "audio_file_id": "Звук ID"
-    },
-    "UstyukovDmitry": {
-        "message": "УУУУУУУУУУУУУУУУ!!!!!! СТАР-МЛАД БРАТ!\n Странно, конечно, что именно это было в мыслях у именинника, когда я к нему подключился🤔\n Но я думаю ты знаешь, что с этим надо делать😂\n",
-        "sticker": "CgACAgQAAxkBAAICjmkjjOocls-BsN8WK8mXGvCdOyyqAALsBAACORStUsjZrX5vPEONNgQ",  # замени на реальный file_id
-        "audio_file_id": "Звук ID"
-    },
-    "Magmelle": {
-        "message": "Кааааатьм!\n Это я залез в голову к старому, а там это🤔\n Я думаю его заветное желание, чтобы вы с Диманом приехали на его праздник😄\n",
-        "gif": "CgACAgQAAxkBAAICjGkji8YuFAymc_ajIBLOOd8op4XZAAKhBgACsAm1Uj5liQt684BHNgQ",  # замени на реальный file_id
-        "audio_file_id": "CQACAgIAAxkBAAICgGkjh0KsyEi4AAG292Hi8vAqY_HbnAAC6JcAAi3dGEmwA0s4DmlLwjYE"
-    },
-    "qMashkap": {
-        "message": "Мария!\n Я прочитал мысли Егорки, он будет очень рад видеть вас на своем празднике,\n и надеется, что у вас обоих на следующий день будет выходной и вы машину оставите у дома😉\n",
-        "gif": "CgACAgQAAxkBAAICkWkjksoO8O0v7VqT264TohF-rAOGAAJBAwACMVAFU7H7QBzlE0qDNgQ",
-        "audio_file_id": "CQACAgIAAxkBAAICe2kjhnaWtnum5X4eKivlQpGZOovjAALglwACLd0YSVpEkBc7Wp-UNgQ"
-    },
-    "k_frfr": {
-        "message": "Залез я в мысли к старому...\n Он говорит:\n Ксю, просто приезжай потусить от души душевно в душу, ничего больше не надо😄\n",
-        "gif": "CgACAgQAAxkBAAICk2kjk76Vahxdb8vAbYjvGHrh14DgAAIFAwACHwKFUw0JzYGGqH1QNgQ",
-        "audio_file_id": "CQACAgIAAxkBAAICgGkjh0KsyEi4AAG292Hi8vAqY_HbnAAC6JcAAi3dGEmwA0s4DmlLwjYE"
-    },
-	"just_katy_15": {
-        "message": "Катя!\n Загружаю мысли Егора...\n Его заветное желание, чтобы вы с Андреем пришли к нему на праздник, но если он работает, придется тусить за двоих😁\n",
-        "gif": "CgACAgQAAxkBAAICj2kjkGZ5MmVhPvEsgpJQHel0S7IRAAK_BQAC0eGlU5GxKYas4VaPNgQ",
-        "audio_file_id": ""
-    },
-    "yuliatikhomirova": {
-        "message": "Я залез в мысли Егорки и там:\n Юлькаааааа!😄\n Его самое заветное желание, если ты придешь на его праздник, я думаю он будет рад больше всего, больше ему ничего не надо 😉\n",
-        "sticker": "CAACAgIAAxkBAAIBFmki36Ce5yk3UR-OKI_NbDrByuTiAAIsAQAC9wLID6abwCn6K4ldNgQ",  # замени на реальный file_id
-        "audio_file_id": "CQACAgIAAxkBAAICgGkjh0KsyEi4AAG292Hi8vAqY_HbnAAC6JcAAi3dGEmwA0s4DmlLwjYE"
-    }
-}
-
-# Обработчик нажатия на inline-кнопку "🎁 Подумать о подарке"
-import random
-
-@dp.callback_query(lambda call: call.data == "gift_button")
-async def handle_gift_button(call: types.CallbackQuery):
-    user_id = call.from_user.id
-    username = call.from_user.username
-    first_name = call.from_user.first_name
-
-    # Загружаем данные пользователя
-    participants = load_participants()
-    user_data = next((p for p in participants if p.get("user_id") == user_id), None)
-
-    # Если подарок уже запрашивали — отправляем короткий ответ
-    if user_data and user_data.get("gift_requested"):
-        short_messages = [
-            "Перегрелся... 🔥",
-            "Я устал... 😴",
-            "Лучший вариант для подарка я уже выдал... 🎁",
-            "Микросхемы в отпуске... ⚙️"
-        ]
-        await call.message.answer(random.choice(short_messages))
-        await call.answer()
-        return
-
-    # Иначе — показываем полную анимацию
-    await call.answer()
-    await call.message.answer("🧠 Прогреваю микросхемы...")
-    await asyncio.sleep(2)
-    await call.message.answer("🔍 Подключаю аналитические сервисы...")
-    await asyncio.sleep(2)
-    await call.message.answer("🕯️ Думаю о имениннике...")
-    await asyncio.sleep(2)
-    await call.message.answer("🎁 Анализирую, что он хочет больше всего...")
-    await asyncio.sleep(2)
-    await call.message.answer("✅ Всё готово, выдаю лучший вариант для подарка")
-    await asyncio.sleep(2)
-
-    # Отправляем персональный подарок
-    sent = False
-    if username and username in SPECIAL_USERS:
-        data = SPECIAL_USERS[username]
-        await send_media_and_message(call.message, data)
-        sent = True
-    elif str(user_id) in SPECIAL_USERS_BY_ID:
-        data = SPECIAL_USERS_BY_ID[str(user_id)]
-        await send_media_and_message(call.message, data)
-        sent = True
-
-    if not sent:
-        COMMON_AUDIO_ID = "CQACAgIAAxkBAAICgGkjh0KsyEi4AAG292Hi8vAqY_HbnAAC6JcAAi3dGEmwA0s4DmlLwjYE"
-        COMMON_STICKER_ID = "CAACAgIAAxkBAAIBGGki4Dc_p6rNax7w9awr0MHtXxk4AALRJQACN3uwSmqrpV8zXhDiNgQ"
-
-        if COMMON_AUDIO_ID:
-            try:
-                await call.message.answer_audio(audio=COMMON_AUDIO_ID, caption="🎵 Включи меня")
-                await asyncio.sleep(2)
-            except Exception:
-                pass
-        if COMMON_STICKER_ID:
-            try:
-                await call.message.answer_sticker(sticker=COMMON_STICKER_ID)
-                await asyncio.sleep(1)
-            except Exception:
-                pass
-
-        greeting = f"@{username}, Я думаю, что самое важное желание именинника, что именно ты придешь на его праздник! 😉" if username else f"{first_name}, Я думаю, что самое важное желание именинника, что именно ты придешь на его праздник! 😉"
-        await call.message.answer(greeting)
-
-    # Сохраняем участника с флагом
-    participant_data = {
-        "user_id": user_id,
-        "username": username or "Не указан",
-        "first_name": first_name,
-        "status": "no_response",
-        "date": "2025-12-06T19:00:00",
-        "address": "г. Рязань, ул. Пугачева, д. 10, кв. 18",
-        "gift_requested": True  # ← ключевая строка
-    }
-    save_participant(participant_data)
-
-    # Кнопки подтверждения
-    keyboard = [
-        [types.InlineKeyboardButton(text="🎉 Я приду!", callback_data="will_come"),
-         types.InlineKeyboardButton(text="😔 Я не приду", callback_data="will_not_come")]
-    ]
-    reply_markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-    await call.message.answer("Ты придёшь на праздник?", reply_markup=reply_markup)
-
-# Обработчик кнопки "Я приду"
-@dp.callback_query(lambda call: call.data == "will_come")
-async def handle_will_come(call: types.CallbackQuery):
-    username = call.from_user.username
-    first_name = call.from_user.first_name
-
-    user_data = {
-        "user_id": call.from_user.id,  # ← обязательно!
-        "username": username or "Не указан",
-        "first_name": first_name,
-        "status": "no_response",
-        "date": "2025-12-06T19:00:00",
-        "address": "г. Рязань, ул. Пугачева, д. 10, кв. 18"
-    }
-    save_participant(user_data)
-
-    # Отправляем стикер отдельно
-    await call.message.answer_sticker(sticker="CAACAgIAAxkBAAIBE2ki32fa1zZsz_DJGDQhV6BJLQbCAAKzCwACKlBRSiyjtgnsadPWNgQ")
-    await call.message.answer(f"{first_name}, ты подтвердил участие в празднике! 🎉")
-
-    # Обновляем кнопки в текущем сообщении
-    keyboard = [[types.InlineKeyboardButton(text="🔄 Изменить ответ", callback_data="change_decision")]]
-    reply_markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-    await call.message.edit_reply_markup(reply_markup=reply_markup)
-    await call.answer()
-
-
-@dp.callback_query(lambda call: call.data == "will_not_come")
-async def handle_will_not_come(call: types.CallbackQuery):
-    username = call.from_user.username
-    first_name = call.from_user.first_name
-
-    user_data = {
-        "user_id": call.from_user.id,  # ← обязательно!
-        "username": username or "Не указан",
-        "first_name": first_name,
-        "status": "no_response",
-        "date": "2025-12-06T19:00:00",
-        "address": "г. Рязань, ул. Пугачева, д. 10, кв. 18"
-    }
-    save_participant(user_data)
-
-    await call.message.answer_sticker(sticker="CAACAgIAAxkBAAIBFWki34lp3tGyZ-eZ06mFrw95ptXbAAInAQAC9wLID-9HhEodcwYsNgQ")
-    await call.message.answer(f"{first_name}, очень жаль, что ты не сможешь прийти 😔")
-
-    keyboard = [[types.InlineKeyboardButton(text="🔄 Изменить ответ", callback_data="change_decision")]]
-    reply_markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-    await call.message.edit_reply_markup(reply_markup=reply_markup)
-    await call.answer()
-
-
-@dp.callback_query(lambda call: call.data == "change_decision")
-async def handle_change_decision(call: types.CallbackQuery):
-    username = call.from_user.username
-    first_name = call.from_user.first_name
-
-    user_data = {
-        "user_id": call.from_user.id,  # ← обязательно!
-        "username": username or "Не указан",
-        "first_name": first_name,
-        "status": "no_response",
-        "date": "2025-12-06T19:00:00",
-        "address": "г. Рязань, ул. Пугачева, д. 10, кв. 18"
-    }
-    save_participant(user_data)
-
-    await call.message.answer("Хорошо, давай еще подумаем!")
-
-    # Обновляем кнопки на выбор
-    keyboard = [
-        [types.InlineKeyboardButton(text="🎉 Я приду!", callback_data="will_come"),
-         types.InlineKeyboardButton(text="😔 Я не приду", callback_data="will_not_come")]
-    ]
-    reply_markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-    await call.message.edit_reply_markup(reply_markup=reply_markup)
-    await call.answer()
-
-@dp.message(Command("reset"))
-async def reset_gifts(message: types.Message):
-    if message.from_user.id != 1353926244:  # 🔐 ТВОЙ ID
-        await message.answer("Команда доступна только владельцу.")
-        return
-
-    try:
-        participants = load_participants()
-        for p in participants:
-            p["gift_requested"] = False  # сбрасываем у всех
-        with open(PARTICIPANTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(participants, f, ensure_ascii=False, indent=2)
-        await message.answer("✅ Все флаги подарков сброшены!")
-    except Exception as e:
-        await message.answer(f"❌ Ошибка: {e}")
-    
-@dp.message(Command("list"))
-async def list_participants(message: types.Message):
-    if message.from_user.id != 1353926244:  # 🔐 ТВОЙ ID
-        await message.answer("Эта команда доступна только владельцу бота.")
-        return
-
-    participants = load_participants()
-    if not participants:
-        await message.answer("Пока никто не откликнулся 😢")
-        return
-
-    text = "✅ Участники праздника:\n\n"
-    for p in participants:
-        first_name = p["first_name"]
-        username = p["username"]
-        status = p.get("status", "no_response")
-        if status == "confirmed":
-            status_text = "✅"
-        elif status == "declined":
-            status_text = "❌"
-        else:
-            status_text = "❓"
-        if username != "Не указан":
-            text += f"• {status_text} {first_name} (@{username})\n"
-        else:
-            text += f"• {status_text} {first_name}\n"
-
-    await message.answer(text)
-    
-async def send_time_info(message: types.Message):
-    address = "г. Рязань, ул. Пугачева, д. 10, кв. 18"
-    time = "6 декабря 2025 года в 19:00"
-    map_link = "https://yandex.ru/maps/-/CLS15OOK"
-
-    keyboard = [[types.InlineKeyboardButton(text="📍 Показать на карте", url=map_link)]]
-    reply_markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-    text = f"📍 **Место**: {address}\n🕗 **Время**: {time}"
-    await message.answer(text, parse_mode="Markdown", reply_markup=reply_markup)
-    
-async def send_bot_info(message: types.Message):
-    text = (
-        "Бот-помощник в организации туц-туц у Егорки 6 декабря 2025 года. ✅\n\n"
-        "Что вам потребуется на данном мероприятии 👇\n"
-        "🟢 Хорошо выспаться перед этим\n"
-        "🟢 Зарядиться отличным настроением\n"
-        "🟡 Машину лучше оставить дома🍺🍻\n"
-        "🙏 У кого есть небольшие складные стулья, возьмите пожалуйста с собой🫶\n\n\n"
-        "oldmanbirthday_bot v.1.0.1\n"
-        "Для связи с создателем: @qdlopoelp"
-    )
-    await message.answer(text)
-
-async def send_reminder_to_eligible():
-    """Отправляет напоминание только тем, кто придет или не ответил"""
-    participants = load_participants()
-    sent_count = 0
-
-    for p in participants:
-        user_id = p.get("user_id")
-        status = p.get("status", "no_response")
-        
-        # Пропускаем тех, кто отказался
-        if status == "declined" or not user_id:
-            continue
-
-        try:
-            first_name = p.get("first_name", "друг")
-            username = p.get("username")
-            name = f"@{username}" if username and username != "Не указан" else first_name
-
-            text = (
-                f"🔔 {name}, доброе утро!\n\n"
-                "💡 Напоминаю: завтра туц-туц у старичка! 🎉\n"
-                "📅 6 декабря 2025 года\n"
-                "🕗 19:00\n"
-                "📍 г. Рязань, ул. Пугачева, д. 10, кв. 18\n\n"
-                "❗ Не забудь:\n"
-                "• Хорошенько выспаться\n"
-                "• Взять с собой отличное настроение\n"
-            )
-            await bot.send_message(user_id, text)
-            sent_count += 1
-        except Exception as e:
-            pass
-
-    print(f"Напоминание отправлено {sent_count} пользователям.")
-
-async def check_and_send_reminder():
-    REMINDER_FLAG_FILE = Path("reminder_sent.flag")
-    reminder_time = datetime.datetime(2025, 12, 5, 12, 0, 0)
-
-    while True:
-        try:
-            now = datetime.datetime.now()
-            if now >= reminder_time and not REMINDER_FLAG_FILE.exists():
-                print("Отправляю напоминания...")
-                await send_reminder_to_eligible()
-                with open(REMINDER_FLAG_FILE, "w") as f:
-                    f.write("sent")
-                print("Напоминания отправлены.")
-                break
-        except Exception as e:
-            print(f"Ошибка в фоновой задаче: {e}")
-        await asyncio.sleep(60)
-        
-# Запуск бота
-async def main():
-    # Запускаем фоновую задачу для напоминания
-    asyncio.create_task(check_and_send_reminder())
-    await dp.start_polling(bot)
-
-if __name__ == "__main__":
-
-    asyncio.run(main())
-
-
-
+import asyncio
+from aiogram import Bot, Dispatcher, types
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ContentType
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from dotenv import load_dotenv
+import os
+import io
+import csv
+import json
+import datetime
+import random
+import logging
+import time
+from pathlib import Path
+from storage import VersionConflict
+from events import EventRegistry
+from templates import TextCatalog
+from broadcast import Broadcaster
+from scheduler import JOB_META_PREFIX, Scheduler
+from media import ASSET_PREFIX, MediaRegistry, MediaSender
+from personalization import Personalization
+from webhook import WebhookServer
+from router import CallbackRouter, ContentRouter
+from middlewares import CallbackDeduplicator, PerUserSerializer
+from cards import CardTracker
+from outbound import OutboundScheduler, TunedAiohttpSession
+from locks import LeaderElection
+from lifecycle import STATE_META_KEY, Lifecycle
+from logs import ApiTraceMiddleware, TraceMiddleware, setup_logging
+from metrics import REGISTRY, ApiMetricsMiddleware, HandlerLabels, HandlerMetricsMiddleware, render_summary, start_metrics_server
+
+# С этого момента считаем время запуска бота: загрузка настроек, текстов и участников (см. main())
+STARTED_AT = time.perf_counter()
+
+# Загружаем .env
+load_dotenv()
+
+# Получаем токен из переменной окружения
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+if not BOT_TOKEN:
+    raise ValueError("Токен бота не найден в файле .env")
+
+# Журнал — JSON lines в stdout (или LOG_FILE), пишется отдельным потоком.
+# Трасса обновления пишется целиком, если попала в выборку LOG_SAMPLE_RATE,
+# обрабатывалась дольше LOG_SLOW_MS или завершилась ошибкой
+setup_logging(
+    os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FILE"),
+    sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "0.01")),
+    slow_ms=float(os.getenv("LOG_SLOW_MS", "500")),
+)
+log = logging.getLogger("bot")
+
+# Режим получения обновлений: "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Настройки webhook: публичный адрес (без него webhook не регистрируется в Telegram —
+# удобно для локальной проверки), где слушать и сколько обновлений обрабатывать одновременно
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_INFLIGHT = int(os.getenv("WEBHOOK_MAX_INFLIGHT", "100"))
+# Метрики в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics (METRICS_PORT=0 — выключить)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Несколько воркеров (см. workers.py): общее хранилище sqlite, планировщик — только у ведущего
+WORKERS = int(os.getenv("WORKERS", "1"))
+# Адрес Bot API; для локальной проверки — поддельный сервер (python bench.py --serve-api 8081)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE")
+if WORKERS > 1 and BOT_MODE != "webhook":
+    raise ValueError("Несколько воркеров работают только в режиме webhook (getUpdates не делится между процессами)")
+WORKER_ID = int(os.getenv("WORKER_ID", "0"))
+# Сколько секунд при остановке ждать идущие обработчики и анимации подарков
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "10"))
+# Соединений к Bot API; воркеров очереди исходящих по умолчанию столько же, чтобы она их не ограничивала
+API_CONNECTIONS = int(os.getenv("API_CONNECTIONS", "100"))
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", str(API_CONNECTIONS)))
+
+# 🔐 ТВОЙ ID — владельцу доступны служебные команды
+OWNER_ID = 1353926244
+
+# ПРАВИЛЬНЫЙ ПУТЬ к файлу участников
+BASE_DIR = Path(__file__).parent
+# Где лежат изменяемые данные (участники, контрольные точки рассылок); по умолчанию — рядом с ботом
+DATA_DIR = Path(os.getenv("DATA_DIR", BASE_DIR))
+PARTICIPANTS_FILE = DATA_DIR / "participants.json"
+# Хранилище участников: "json" — один файл, "journal" — снимок + журнал изменений,
+# "sqlite" — participants.db (перенос из JSON: python storage.py participants.json participants.db)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+# Мероприятия: адрес, время, напоминания; у каждого свой файл участников в DATA_DIR
+EVENTS_FILE = BASE_DIR / "events.json"
+# Тексты для гостей на всех языках: правка формулировок и переводов — только там
+TEXTS_FILE = BASE_DIR / "texts.json"
+
+# Тексты разбираются один раз; клавиатуры и карточки мероприятий собираются по ним при загрузке
+catalog = TextCatalog(TEXTS_FILE)
+catalog.load()
+# Загружаем мероприятия и их участников при запуске — дальше работаем с ними в памяти
+events = EventRegistry(EVENTS_FILE, DATA_DIR, catalog, STORAGE_BACKEND, shared=WORKERS > 1)
+events.load()
+# Шард мероприятия по умолчанию хранит и служебные данные бота (задания, реестр медиа)
+participants_store = events.default.store
+
+# Сохраняем участника мероприятия по user_id: обновляются только указанные поля, остальное сохраняем.
+# На диск изменения уходят фоновой задачей (см. ParticipantStore).
+# expected_version — версия, прочитанная до await'ов (иначе VersionConflict)
+async def save_participant(event, user_data, expected_version=None):
+    return await event.store.asave({**user_data, "event_id": event.id}, expected_version=expected_version)
+
+def participant_fields(user: types.User, **fields):
+    """Поля записи участника из профиля Telegram; дата и адрес берутся из мероприятия, а не копируются.
+    Язык запоминаем, чтобы напоминания приходили на нём же"""
+    return {"user_id": user.id, "username": user.username or "Не указан", "first_name": user.first_name,
+            "language_code": user.language_code, **fields}
+
+# Реестр медиа: файлы из assets/ загружаются в Telegram один раз (в чат владельца),
+# дальше подарки ссылаются на них как "#имя"
+ASSETS_DIR = BASE_DIR / "assets"
+media_assets = MediaRegistry(participants_store, ASSETS_DIR)
+# file_id общего подарка, полученные до появления реестра
+media_assets.seed({
+    "common_audio": ("audio", "CQACAgIAAxkBAAICgGkjh0KsyEi4AAG292Hi8vAqY_HbnAAC6JcAAi3dGEmwA0s4DmlLwjYE"),
+    "common_sticker": ("sticker", "CAACAgIAAxkBAAIBGGki4Dc_p6rNax7w9awr0MHtXxk4AALRJQACN3uwSmqrpV8zXhDiNgQ"),
+    "will_come_sticker": ("sticker", "CAACAgIAAxkBAAIBE2ki32fa1zZsz_DJGDQhV6BJLQbCAAKzCwACKlBRSiyjtgnsadPWNgQ"),
+    "will_not_come_sticker": ("sticker", "CAACAgIAAxkBAAIBFWki34lp3tGyZ-eZ06mFrw95ptXbAAInAQAC9wLID-9HhEodcwYsNgQ"),
+})
+
+# Отправка подарков: заглушки и отвергнутые Telegram file_id отсеиваются заранее.
+# Порядок частей в чате держит очередь исходящих запросов, поэтому без своего шага
+media_sender = MediaSender(participants_store, stagger=0, assets=media_assets)
+
+async def send_media_and_message(message_obj, user_data, audio_caption):
+    """Отправляет стикер/GIF/аудио и сообщение из user_data"""
+    await media_sender.send_media_and_message(message_obj, user_data, audio_caption=audio_caption)
+    
+# Все запросы к Bot API идут через общую очередь с приоритетами:
+# ответы пользователям, затем подарки, затем рассылки
+outbound = OutboundScheduler(workers=OUTBOUND_WORKERS)
+session = TunedAiohttpSession(limit=API_CONNECTIONS)
+if TELEGRAM_API_BASE:
+    session.api = TelegramAPIServer.from_base(TELEGRAM_API_BASE)
+# Спан вызова API — снаружи очереди, чтобы в трассе было видно и ожидание в ней
+session.middleware(ApiTraceMiddleware())
+session.middleware(outbound)
+# Считаем только сами HTTP-запросы, без ожидания в очереди
+session.middleware(ApiMetricsMiddleware())
+
+# Инициализируем бота и диспетчер
+bot = Bot(token=BOT_TOKEN, session=session)
+dp = Dispatcher()
+# Остановка и перезапуск: первым делом отсеиваем обновления, обработанные до перезапуска.
+# Снимок у каждого воркера свой — обновления одного пользователя всегда идут к одному воркеру
+lifecycle = Lifecycle(participants_store, key=f"{STATE_META_KEY}:{WORKER_ID}" if WORKERS > 1 else STATE_META_KEY,
+                      drain_timeout=SHUTDOWN_TIMEOUT)
+dp.update.outer_middleware(lifecycle)
+# Нажатия inline-кнопок и медиа-сообщения разбираются по словарю, а не цепочкой фильтров
+# (регистрируются в диспетчере в конце файла, после команд)
+callback_router = CallbackRouter()
+content_router = ContentRouter()
+# Метка обработчика в метриках и трассах: только известные действия кнопок и команды
+# (команды дописываются в конце файла, когда все обработчики зарегистрированы)
+KNOWN_COMMANDS = set()
+handler_labels = HandlerLabels(callback_router.actions, KNOWN_COMMANDS)
+# Трасса обновления: id во всех записях журнала, спаны API и хранилища
+dp.update.outer_middleware(TraceMiddleware(handler_labels))
+# Повторные нажатия той же кнопки, пока первое обрабатывается (и 2 секунды после), — только answer()
+dp.update.outer_middleware(CallbackDeduplicator())
+# Обновления одного пользователя — по очереди, разных пользователей — параллельно
+dp.update.outer_middleware(PerUserSerializer())
+# Время и ошибки обработчиков — для /stats и /metrics
+dp.message.middleware(HandlerMetricsMiddleware(handler_labels))
+dp.callback_query.middleware(HandlerMetricsMiddleware(handler_labels))
+broadcaster = Broadcaster(bot, checkpoint_path=DATA_DIR / "broadcast_checkpoint.json")
+
+
+def message_media(message: types.Message):
+    """(тип, file_id, file_unique_id) аудио, стикера или GIF из сообщения, иначе None"""
+    for kind in ("audio", "sticker", "animation"):
+        media = getattr(message, kind)
+        if media is not None:
+            return kind, media.file_id, media.file_unique_id
+    return None
+
+def register_asset(name, message: types.Message):
+    kind, file_id, unique_id = message_media(message)
+    media_assets.register(name, kind, file_id, unique_id=unique_id)
+    return f"✅ Сохранено как {ASSET_PREFIX}{name} ({kind}). В подарках: \"{ASSET_PREFIX}{name}\""
+
+# Аудио, стикеры и GIF от владельца: с подписью "#имя" сразу попадают в реестр медиа,
+# без подписи — бот присылает file_id и подсказку
+@content_router.content_type(ContentType.AUDIO)
+@content_router.content_type(ContentType.STICKER)
+@content_router.content_type(ContentType.ANIMATION)
+async def handle_owner_media(message: types.Message):
+    if message.from_user.id != OWNER_ID:
+        return
+    caption = (message.caption or "").strip()
+    if caption.startswith(ASSET_PREFIX):
+        try:
+            await message.answer(register_asset(caption[len(ASSET_PREFIX):].split()[0], message))
+        except (ValueError, IndexError) as e:
+            await message.answer(f"Не сохранено: {e}")
+        return
+    kind, file_id, _ = message_media(message)
+    await message.answer(
+        f"{kind} file_id:\n<code>{file_id}</code>\n\n"
+        f"Чтобы сохранить в реестр, ответь на сообщение с медиа: /asset имя",
+        parse_mode="HTML",
+    )
+
+@dp.message(Command("asset"))
+async def asset_command(message: types.Message):
+    """/asset имя — в ответ на медиа; без ответа — список реестра"""
+    if message.from_user.id != OWNER_ID:
+        await message.answer("Команда доступна только владельцу.")
+        return
+
+    parts = (message.text or "").split()
+    reply = message.reply_to_message
+    if len(parts) > 1 and reply is not None and message_media(reply) is not None:
+        try:
+            await message.answer(register_asset(parts[1].lstrip(ASSET_PREFIX), reply))
+        except ValueError as e:
+            await message.answer(f"Не сохранено: {e}")
+        return
+
+    if not media_assets.assets:
+        await message.answer("Реестр медиа пуст. Ответь на аудио/стикер/GIF командой /asset имя.")
+        return
+    lines = [
+        f"• {ASSET_PREFIX}{name} — {entry['kind']}" + ("" if entry.get("file_id") else " (ждёт загрузки)")
+        for name, entry in sorted(media_assets.assets.items())
+    ]
+    await message.answer("🗂 Медиа:\n\n" + "\n".join(lines))
+    
+# Обработчик команды /start; /start <id мероприятия> — приглашение на конкретное мероприятие
+@dp.message(Command("start"))
+async def send_welcome(message: types.Message, command: CommandObject):
+    event = events.get(command.args) or events.default
+    # Текст и клавиатура собраны заранее для языка пользователя; в кнопках зашит id мероприятия
+    view = event.view(message.from_user.language_code)
+    await message.answer(view["welcome"], reply_markup=view.menu_markup)
+
+async def resolve_event(call: types.CallbackQuery, event_id):
+    """Мероприятие кнопки; если его уже нет в events.json — убираем «часики» и возвращаем None"""
+    event = events.get(event_id)
+    if event is None:
+        await call.answer(catalog.texts(call.from_user.language_code)["event_unavailable"])
+    return event
+
+# Какая карточка в каком сообщении уже показана — правим её, а не удаляем и шлём заново
+card_tracker = CardTracker(bot)
+
+async def show_info_card(call: types.CallbackQuery, card):
+    result = await card_tracker.show(call.message, card)
+    if result == CardTracker.UNCHANGED:
+        await call.answer(catalog.texts(call.from_user.language_code)["card_above"])
+    else:
+        await call.answer()
+
+# Inline-кнопка "Место и время"
+@callback_router.action("time_info")
+async def handle_time_info(call: types.CallbackQuery, event_id=None):
+    event = await resolve_event(call, event_id)
+    if event is not None:
+        await show_info_card(call, event.view(call.from_user.language_code).time_card)
+
+# Inline-кнопка "Информация"
+@callback_router.action("bot_info")
+async def handle_bot_info(call: types.CallbackQuery, event_id=None):
+    event = await resolve_event(call, event_id)
+    if event is not None:
+        await show_info_card(call, event.view(call.from_user.language_code).info_card)
+
+# Индивидуальные данные для особых пользователей — в personalization.json
+# ("by_id" — по user_id, "by_username" — по username). Файл перечитывается на лету
+personalization = Personalization(BASE_DIR / "personalization.json")
+personalization.load()
+
+# Обработчик нажатия на inline-кнопку "🎁 Подумать о подарке"
+# Этапы «раздумий» перед подарком (gift_stages в texts.json) показываются в одном сообщении по очереди.
+# Пауза между этапами анимации, секунды
+GIFT_STAGE_DELAY = 2
+
+# Идущие анимации подарка: (id мероприятия, user_id) -> задача
+gift_tasks = {}
+
+@callback_router.action("gift_button")
+async def handle_gift_button(call: types.CallbackQuery, event_id=None):
+    event = await resolve_event(call, event_id)
+    if event is None:
+        return
+    user_id = call.from_user.id
+    view = event.view(call.from_user.language_code)
+
+    # Загружаем данные пользователя
+    user_data = event.store.get(user_id)
+
+    # Если подарок уже запрашивали — отправляем короткий ответ
+    if user_data and user_data.get("gift_requested"):
+        await call.message.answer(random.choice(view["gift_short"]))
+        await call.answer()
+        return
+
+    # Анимация уже идёт (повторное нажатие) — вторую не запускаем
+    key = (event.id, user_id)
+    task = gift_tasks.get(key)
+    if task is not None and not task.done():
+        await call.answer(view["gift_in_progress"])
+        return
+
+    # Иначе — запускаем полную анимацию в фоне, handler сразу освобождается.
+    # Версию записи запоминаем сейчас: сохранение будет через ~10 секунд
+    version = event.store.version(user_id)
+    await call.answer()
+    # При остановке анимацию дожидаемся, чтобы подарок не потерялся
+    task = lifecycle.track(asyncio.create_task(run_gift_flow(event, call.message, call.from_user, version)))
+    gift_tasks[key] = task
+    task.add_done_callback(lambda t: gift_tasks.pop(key, None) if gift_tasks.get(key) is t else None)
+
+async def run_gift_flow(event, message: types.Message, user: types.User, version):
+    """Анимация «раздумий» в одном сообщении, затем подарок и кнопки ответа"""
+    stages = event.view(user.language_code)["gift_stages"]
+    try:
+        thinking = await message.answer(stages[0])
+        for stage in stages[1:]:
+            await asyncio.sleep(GIFT_STAGE_DELAY)
+            await thinking.edit_text(stage)
+        await asyncio.sleep(GIFT_STAGE_DELAY)
+        await deliver_gift(event, message, user, version)
+    except Exception:
+        log.exception("Ошибка при выдаче подарка пользователю %s", user.id)
+
+async def deliver_gift(event, message: types.Message, user: types.User, version=None):
+    """Подарок (персональный или общий), флаг gift_requested и кнопки ответа"""
+    user_id, username, first_name = user.id, user.username, user.first_name
+    view = event.view(user.language_code)
+    # Отправляем персональный подарок
+    sent = False
+    data = personalization.lookup(user_id, username)
+    if data is not None:
+        await send_media_and_message(message, data, view["personal_audio_caption"])
+        sent = True
+
+    if not sent:
+        greeting = view["gift_greeting"].render(name=f"@{username}" if username else first_name)
+        common_gift = {"audio": "#common_audio", "sticker": "#common_sticker", "message": greeting}
+        await send_media_and_message(message, common_gift, view["gift_audio_caption"])
+
+    # Сохраняем участника с флагом
+    participant_data = participant_fields(user, status="no_response", gift_requested=True)
+    try:
+        await save_participant(event, participant_data, expected_version=version)
+    except VersionConflict:
+        # Пока шла анимация, запись изменилась (например, пришёл ответ «приду»):
+        # ставим флаг подарка, а уже сохранённые поля не перетираем
+        current = event.store.get(user_id) or {}
+        await save_participant(event, {k: v for k, v in participant_data.items() if k in ("user_id", "gift_requested") or k not in current})
+
+    # Кнопки подтверждения
+    await message.answer(view["rsvp_question"], reply_markup=view.rsvp_markup)
+
+# Обработчик кнопки "Я приду"
+@callback_router.action("will_come")
+async def handle_will_come(call: types.CallbackQuery, event_id=None):
+    event = await resolve_event(call, event_id)
+    if event is None:
+        return
+    view = event.view(call.from_user.language_code)
+
+    # Ответ уже сохранён — повторное нажатие ничего не отправляет
+    if (event.store.get(call.from_user.id) or {}).get("status") == "confirmed":
+        await call.answer(view["answer_saved"])
+        return
+
+    await save_participant(event, participant_fields(call.from_user, status="confirmed"))
+
+    # Стикер из реестра: отвергнутый Telegram file_id не помешает ответу
+    await media_sender.send_media_and_message(call.message, {
+        "sticker": "#will_come_sticker",
+        "message": view["will_come"].render(first_name=call.from_user.first_name),
+    })
+
+    # Обновляем кнопки в текущем сообщении
+    await call.message.edit_reply_markup(reply_markup=view.change_markup)
+    await call.answer()
+
+
+@callback_router.action("will_not_come")
+async def handle_will_not_come(call: types.CallbackQuery, event_id=None):
+    event = await resolve_event(call, event_id)
+    if event is None:
+        return
+    view = event.view(call.from_user.language_code)
+
+    if (event.store.get(call.from_user.id) or {}).get("status") == "declined":
+        await call.answer(view["answer_saved"])
+        return
+
+    await save_participant(event, participant_fields(call.from_user, status="declined"))
+
+    await media_sender.send_media_and_message(call.message, {
+        "sticker": "#will_not_come_sticker",
+        "message": view["will_not_come"].render(first_name=call.from_user.first_name),
+    })
+
+    await call.message.edit_reply_markup(reply_markup=view.change_markup)
+    await call.answer()
+
+
+@callback_router.action("change_decision")
+async def handle_change_decision(call: types.CallbackQuery, event_id=None):
+    event = await resolve_event(call, event_id)
+    if event is None:
+        return
+
+    await save_participant(event, participant_fields(call.from_user, status="no_response"))
+    view = event.view(call.from_user.language_code)
+
+    await call.message.answer(view["change_decision"])
+
+    # Обновляем кнопки на выбор
+    await call.message.edit_reply_markup(reply_markup=view.rsvp_markup)
+    await call.answer()
+
+async def owner_event(message: types.Message, event_id):
+    """Мероприятие для служебной команды: по id из аргумента или по умолчанию"""
+    event = events.get(event_id)
+    if event is None:
+        await message.answer(f"Мероприятия {event_id} нет. Список: /events")
+    return event
+
+@dp.message(Command("reset"))
+async def reset_gifts(message: types.Message, command: CommandObject):
+    """/reset [id мероприятия]"""
+    if message.from_user.id != OWNER_ID:
+        await message.answer("Команда доступна только владельцу.")
+        return
+    event = await owner_event(message, command.args)
+    if event is None:
+        return
+
+    try:
+        event.store.reset_gifts()
+        await event.store.flush()
+        await message.answer("✅ Все флаги подарков сброшены!")
+    except Exception as e:
+        log.exception("Не удалось сбросить флаги подарков")
+        await message.answer(f"❌ Ошибка: {e}")
+    
+# Сколько участников на странице /list и с какого размера списка сразу прикладывать файл
+LIST_PAGE_SIZE = 30
+LIST_EXPORT_THRESHOLD = 200
+
+STATUS_ICONS = {"confirmed": "✅", "declined": "❌"}
+
+def participants_summary(event):
+    counts = event.store.count_by_status()
+    return (
+        f"✅ Придут: {counts.get('confirmed', 0)}  "
+        f"❌ Не придут: {counts.get('declined', 0)}  "
+        f"❓ Не ответили: {counts.get('no_response', 0)}\n"
+        f"Всего: {len(event.store)}"
+    )
+
+def render_participants_page(event, page):
+    """Текст и клавиатура одной страницы /list"""
+    total = len(event.store)
+    pages = max(1, (total + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+
+    text = f"✅ Участники: {event.title}\n" + participants_summary(event) + "\n\n"
+    for p in event.store.page(page * LIST_PAGE_SIZE, LIST_PAGE_SIZE):
+        first_name = p.get("first_name", "—")
+        username = p.get("username", "Не указан")
+        status_text = STATUS_ICONS.get(p.get("status", "no_response"), "❓")
+        if username != "Не указан":
+            text += f"• {status_text} {first_name} (@{username})\n"
+        else:
+            text += f"• {status_text} {first_name}\n"
+
+    navigation = []
+    if page > 0:
+        navigation.append(types.InlineKeyboardButton(text="◀️", callback_data=event.callback("list_page", page - 1)))
+    navigation.append(types.InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data=event.callback("list_page", page)))
+    if page < pages - 1:
+        navigation.append(types.InlineKeyboardButton(text="▶️", callback_data=event.callback("list_page", page + 1)))
+    keyboard = [
+        navigation,
+        [types.InlineKeyboardButton(text="📄 CSV", callback_data=event.callback("list_export", "csv")),
+         types.InlineKeyboardButton(text="📄 JSON", callback_data=event.callback("list_export", "json"))]
+    ]
+    return text, types.InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+# Ячейку с таким началом Excel считает формулой — а имя и username задаёт сам гость
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def csv_cell(value):
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def build_participants_export(event, fmt):
+    """Весь список участников мероприятия файлом (CSV или JSON)"""
+    participants = event.store.all()
+    if fmt == "json":
+        data = json.dumps(participants, ensure_ascii=False, indent=2).encode("utf-8")
+    else:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["user_id", "username", "first_name", "status", "gift_requested"])
+        for p in participants:
+            writer.writerow([csv_cell(value) for value in (
+                p.get("user_id"), p.get("username", ""), p.get("first_name", ""),
+                p.get("status", "no_response"), p.get("gift_requested", False),
+            )])
+        # BOM — чтобы Excel открыл кириллицу без танцев
+        data = out.getvalue().encode("utf-8-sig")
+        fmt = "csv"
+    return types.BufferedInputFile(data, filename=f"participants-{event.id}.{fmt}")
+
+async def send_participants_export(message: types.Message, event, fmt):
+    document = build_participants_export(event, fmt)
+    await message.answer_document(document, caption=participants_summary(event))
+
+@dp.message(Command("list"))
+async def list_participants(message: types.Message, command: CommandObject):
+    """/list [id мероприятия]"""
+    if message.from_user.id != OWNER_ID:
+        await message.answer("Эта команда доступна только владельцу бота.")
+        return
+    event = await owner_event(message, command.args)
+    if event is None:
+        return
+
+    if not len(event.store):
+        await message.answer("Пока никто не откликнулся 😢")
+        return
+
+    text, reply_markup = render_participants_page(event, 0)
+    await message.answer(text, reply_markup=reply_markup)
+    # Длинный список удобнее смотреть файлом
+    if len(event.store) > LIST_EXPORT_THRESHOLD:
+        await send_participants_export(message, event, "csv")
+
+@callback_router.action("list_page")
+async def handle_list_page(call: types.CallbackQuery, page="0", event_id=None):
+    if call.from_user.id != OWNER_ID:
+        await call.answer()
+        return
+    event = await resolve_event(call, event_id)
+    if event is None:
+        return
+
+    text, reply_markup = render_participants_page(event, int(page))
+    try:
+        await call.message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest:
+        pass  # та же страница — Telegram отвечает «message is not modified»
+    await call.answer()
+
+@callback_router.action("list_export")
+async def handle_list_export(call: types.CallbackQuery, fmt="csv", event_id=None):
+    if call.from_user.id != OWNER_ID:
+        await call.answer()
+        return
+    event = await resolve_event(call, event_id)
+    if event is None:
+        return
+
+    await call.answer()
+    await send_participants_export(call.message, event, fmt)
+
+@dp.message(Command("export"))
+async def export_participants(message: types.Message):
+    """/export [csv|json] [id мероприятия]"""
+    if message.from_user.id != OWNER_ID:
+        await message.answer("Эта команда доступна только владельцу бота.")
+        return
+
+    parts = (message.text or "").split()
+    event = await owner_event(message, parts[2] if len(parts) > 2 else None)
+    if event is None:
+        return
+    await send_participants_export(message, event, parts[1] if len(parts) > 1 else "csv")
+
+@dp.message(Command("events"))
+async def list_events(message: types.Message):
+    """Мероприятия, число участников и ссылки-приглашения"""
+    if message.from_user.id != OWNER_ID:
+        await message.answer("Команда доступна только владельцу.")
+        return
+
+    me = await bot.me()
+    lines = []
+    for event in events:
+        mark = " (по умолчанию)" if event is events.default else ""
+        lines.append(
+            f"• {event}{mark}\n"
+            f"  участников: {len(event.store)}, https://t.me/{me.username}?start={event.id}"
+        )
+    await message.answer("📅 Мероприятия:\n\n" + "\n".join(lines), disable_web_page_preview=True)
+
+
+# Тексты напоминаний (reminder и reminder_kinds) — в texts.json; виды напоминаний — те, что описаны там
+REMINDER_KINDS = tuple(catalog.texts()["reminder_kinds"])
+
+def display_name(p, view):
+    first_name = p.get("first_name") or view["friend"]
+    username = p.get("username")
+    return f"@{username}" if username and username != "Не указан" else first_name
+
+async def send_reminder_to_eligible(kind="day_before", event_id=None, job_id=None):
+    """Отправляет напоминание только тем, кто придет или не ответил"""
+    event = events.get(event_id)
+    if event is None:
+        log.warning("Напоминание %s: мероприятия %s нет", job_id, event_id)
+        return
+    # Отказавшихся отбирает само хранилище
+    participants = await event.store.eligible_for_reminder()
+    recipients = []
+
+    for p in participants:
+        user_id = p.get("user_id")
+        if not user_id:
+            continue
+        # Шаблон уже с полями мероприятия — подставляем только имя
+        view = event.view(p.get("language_code"))
+        recipients.append((user_id, view.reminders[kind].render(name=display_name(p, view))))
+
+    # Параллельно, с учётом лимитов Telegram; после перезапуска продолжит с места остановки
+    report = await broadcaster.run(job_id or f"{event.id}:reminder-{kind}", recipients)
+    log.info("%s", report)
+
+async def send_followup_to_no_response(event_id=None, job_id=None):
+    """Переспрашивает тех, кто так и не ответил, придут ли они"""
+    event = events.get(event_id)
+    if event is None:
+        log.warning("Повторный вопрос %s: мероприятия %s нет", job_id, event_id)
+        return
+    recipients = []
+    for p in event.store.with_status("no_response"):
+        view = event.view(p.get("language_code"))
+        recipients.append((p["user_id"], view["followup"].render(name=display_name(p, view)),
+                           {"reply_markup": view.rsvp_markup}))
+    report = await broadcaster.run(job_id or f"{event.id}:followup-no-response", recipients)
+    log.info("%s", report)
+
+# Запланированные задания: напоминания, повторные вопросы и т.п.
+scheduler = Scheduler(participants_store, {
+    "reminder": send_reminder_to_eligible,
+    "followup": send_followup_to_no_response,
+})
+scheduler.load()
+
+def seed_default_jobs():
+    """Один раз на мероприятие ставит в план напоминания из events.json"""
+    seeded = set(participants_store.get_meta("seeded_events", []))
+    # Напоминание мероприятия по умолчанию поставлено ещё до появления events.json
+    if participants_store.get_meta("default_jobs_seeded"):
+        seeded.add(events.default.id)
+    now = datetime.datetime.now()
+    for event in events:
+        if event.id in seeded:
+            continue
+        for reminder in event.reminders:
+            run_at = datetime.datetime.fromisoformat(reminder["at"])
+            if run_at <= now:
+                continue  # мероприятие добавили поздно — прошедшие напоминания не шлём
+            kind = reminder.get("kind", "day_before")
+            scheduler.add(run_at, "reminder", {"kind": kind, "event_id": event.id},
+                          job_id=f"{event.id}:reminder-{kind}")
+        seeded.add(event.id)
+    participants_store.set_meta("seeded_events", sorted(seeded))
+
+@dp.message(Command("jobs"))
+async def list_jobs(message: types.Message):
+    if message.from_user.id != OWNER_ID:
+        await message.answer("Команда доступна только владельцу.")
+        return
+
+    scheduler.load()
+    jobs = scheduler.list()
+    if not jobs:
+        await message.answer("Запланированных заданий нет.")
+        return
+    await message.answer("🗓 Задания:\n\n" + "\n".join(f"• {job}" for job in jobs))
+
+@dp.message(Command("addjob"))
+async def add_job(message: types.Message):
+    """/addjob 2025-12-06 17:00 reminder kind=two_hours [event_id=...]"""
+    if message.from_user.id != OWNER_ID:
+        await message.answer("Команда доступна только владельцу.")
+        return
+
+    parts = (message.text or "").split()[1:]
+    try:
+        run_at = datetime.datetime.strptime(f"{parts[0]} {parts[1]}", "%Y-%m-%d %H:%M")
+        action = parts[2]
+        args = dict(arg.split("=", 1) for arg in parts[3:])
+        if action == "reminder" and args.get("kind", "day_before") not in REMINDER_KINDS:
+            raise ValueError(f"kind должен быть одним из: {', '.join(REMINDER_KINDS)}")
+        if events.get(args.get("event_id")) is None:
+            raise ValueError(f"нет мероприятия {args['event_id']}")
+        job = scheduler.add(run_at, action, args)
+    except (IndexError, ValueError) as e:
+        await message.answer(
+            "Формат: /addjob ГГГГ-ММ-ДД ЧЧ:ММ действие [ключ=значение ...]\n"
+            f"Действия: {', '.join(scheduler.actions)}\n"
+            f"Ошибка: {e}"
+        )
+        return
+    await message.answer(f"✅ Запланировано: {job}")
+
+@dp.message(Command("canceljob"))
+async def cancel_job(message: types.Message):
+    if message.from_user.id != OWNER_ID:
+        await message.answer("Команда доступна только владельцу.")
+        return
+
+    parts = (message.text or "").split()
+    if len(parts) < 2:
+        await message.answer("Формат: /canceljob <id>")
+        return
+    scheduler.load()
+    if scheduler.cancel(parts[1]):
+        await message.answer("✅ Задание отменено.")
+    else:
+        await message.answer("Такого задания нет.")
+
+@dp.message(Command("stats"))
+async def show_stats(message: types.Message):
+    if message.from_user.id != OWNER_ID:
+        await message.answer("Команда доступна только владельцу.")
+        return
+    await message.answer(render_summary())
+
+# Датчики читаются в момент запроса /stats или /metrics
+REGISTRY.gauge("outbound_queue_depth", outbound.depth, label="priority")
+REGISTRY.gauge("broadcast_pending", broadcaster.pending, label="broadcast")
+REGISTRY.gauge("participants", lambda: {event.id: len(event.store) for event in events}, label="event")
+REGISTRY.gauge("scheduled_jobs", lambda: len(scheduler.list()))
+
+# Подключаем маршрутизаторы: все нажатия кнопок — одним обработчиком,
+# медиа — после команд, чтобы обычные сообщения не проверялись на аудио/стикер/GIF первыми
+dp.callback_query.register(callback_router.dispatch)
+dp.message.register(content_router.dispatch, content_router.accepts)
+KNOWN_COMMANDS.update(
+    command
+    for handler in dp.message.handlers
+    for handler_filter in handler.filters or ()
+    if isinstance(handler_filter.callback, Command)
+    for command in handler_filter.callback.commands
+    if isinstance(command, str)
+)
+        
+# Задачи, которые должны идти в одном экземпляре на все воркеры
+async def run_leader_tasks():
+    scheduler.migrate_legacy()
+    scheduler.load()  # пока ждали, задания могли поменять другие воркеры
+    seed_default_jobs()
+    # Загружаем новые и изменённые файлы из assets/ (уже загруженные пропускаются)
+    lifecycle.background(asyncio.create_task(media_assets.sync(bot, OWNER_ID)))
+    if participants_store.shared:
+        lifecycle.background(asyncio.create_task(follow_shared_jobs()))
+    await scheduler.run()
+
+async def follow_shared_jobs(interval=5):
+    """Ведущий подхватывает задания, добавленные через других воркеров"""
+    known = participants_store.get_meta_items(JOB_META_PREFIX)
+    while True:
+        await asyncio.sleep(interval)
+        jobs = participants_store.get_meta_items(JOB_META_PREFIX)
+        if jobs != known:
+            known = jobs
+            scheduler.load()
+
+# Ведущий — процесс, который держит блокировку leader.lock; с одним процессом это он сам
+leader = LeaderElection(DATA_DIR / "leader.lock")
+
+# Запуск бота
+async def main():
+    lifecycle.install_signal_handlers()
+    # Планировщик заданий (напоминания и т.п.) — только у ведущего
+    lifecycle.background(asyncio.create_task(leader.run(run_leader_tasks)))
+    # Следим за изменениями personalization.json
+    lifecycle.background(asyncio.create_task(personalization.watch()))
+    metrics_runner = None
+    if METRICS_PORT:
+        try:
+            metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            log.error("Не удалось запустить сервер метрик на %s:%s: %s", METRICS_HOST, METRICS_PORT, e)
+    intake = None
+    try:
+        if BOT_MODE == "webhook":
+            server = WebhookServer(
+                bot, dp,
+                host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                base_url=WEBHOOK_BASE_URL, secret=WEBHOOK_SECRET,
+                max_inflight=WEBHOOK_MAX_INFLIGHT, drain_timeout=SHUTDOWN_TIMEOUT,
+            )
+            REGISTRY.gauge("webhook_inflight", server.inflight)
+            intake = asyncio.create_task(server.run())
+        else:
+            # Сигналы обрабатывает lifecycle, сессию закрываем сами — после того, как обработчики допишут ответы
+            intake = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+        log.info("Запуск занял %.0f мс", (time.perf_counter() - STARTED_AT) * 1000)
+        await lifecycle.wait(intake)
+    finally:
+        # Перестаём принимать обновления
+        if intake is not None and not intake.done():
+            try:
+                await dp.stop_polling()
+            except RuntimeError:  # webhook или polling ещё не успел запуститься
+                intake.cancel()
+            await asyncio.gather(intake, return_exceptions=True)
+        # Дожидаемся обработчиков и анимаций подарков, фоновые задачи отменяем
+        await lifecycle.drain()
+        # Идущие рассылки сохраняют контрольную точку и продолжатся после перезапуска
+        await scheduler.stop()
+        lifecycle.save()
+        # Сбрасываем на диск то, что ещё не успело записаться
+        await events.close()
+        await outbound.close()
+        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if lifecycle.skipped:
+            log.info("Пропущено повторно доставленных обновлений: %d", lifecycle.skipped)
+
+if __name__ == "__main__":
+
+    asyncio.run(main())
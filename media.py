@@ -0,0 +1,232 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import re
+from pathlib import Path
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+from outbound import MEDIA, request_priority
+
+log = logging.getLogger(__name__)
+
+# Ключ в служебных данных хранилища со списком file_id, которые Telegram отверг
+REJECTED_META_KEY = "rejected_file_ids"
+
+# file_id — base64url без паддинга; всё остальное (пустые строки, "Звук ID") — заглушки
+FILE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{20,}$")
+
+# Ответы Telegram, после которых file_id пробовать бессмысленно.
+# Остальные BadRequest (чат, права, подпись) к самому файлу отношения не имеют
+BAD_FILE_ID_RE = re.compile(r"file identifier|file_id|wrong type of the web page content", re.IGNORECASE)
+
+# Первый байт file_id — тип файла в Telegram
+FILE_TYPES = {8: "sticker", 9: "audio", 10: "animation"}
+
+DEFAULT_AUDIO_CAPTION = "🎵 Включи меня!"
+
+# Ключ в служебных данных хранилища с реестром медиа: имя -> {kind, file_id, sha256 | unique_id}
+ASSETS_META_KEY = "media_assets"
+
+# Ссылка на медиа из реестра в подарках: "#имя" вместо file_id
+ASSET_PREFIX = "#"
+ASSET_NAME_RE = re.compile(r"^[\w-]{1,64}$")
+
+# Тип медиа по расширению файла в папке ассетов
+ASSET_EXTENSIONS = {
+    ".mp3": "audio", ".m4a": "audio", ".ogg": "audio", ".flac": "audio", ".wav": "audio",
+    ".webp": "sticker", ".tgs": "sticker", ".webm": "sticker",
+    ".gif": "animation", ".mp4": "animation",
+}
+
+
+def file_type(file_id):
+    """Тип файла по самому file_id (sticker / audio / animation) или None"""
+    try:
+        head = base64.urlsafe_b64decode(file_id[:4])
+    except (binascii.Error, ValueError):
+        return None
+    return FILE_TYPES.get(head[0]) if head else None
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaRegistry:
+    """Реестр медиа: логическое имя -> file_id в Telegram.
+
+    Файлы из assets_dir (имя файла без расширения — имя ассета) загружаются
+    в Telegram один раз: file_id запоминается вместе с хешем содержимого
+    в служебных данных хранилища, и при следующих запусках файл не
+    перезагружается, пока не изменится. Файл с тем же содержимым под другим
+    именем получает уже известный file_id. Пересланные боту медиа
+    регистрируются по file_unique_id.
+    """
+
+    def __init__(self, store, assets_dir):
+        self.store = store
+        self.assets_dir = Path(assets_dir)
+
+    @property
+    def assets(self):
+        # Читаем из хранилища каждый раз: ассет мог зарегистрировать другой воркер
+        return self.store.get_meta(ASSETS_META_KEY, {})
+
+    def _save(self, assets):
+        self.store.set_meta(ASSETS_META_KEY, assets)
+
+    def get(self, name):
+        return self.assets.get(name)
+
+    def resolve(self, value):
+        """Ссылку "#имя" заменяет на file_id из реестра (None, если его ещё нет); остальное — как есть"""
+        if not isinstance(value, str) or not value.startswith(ASSET_PREFIX):
+            return value
+        entry = self.assets.get(value[len(ASSET_PREFIX):])
+        return entry.get("file_id") if entry else None
+
+    def register(self, name, kind, file_id, **source):
+        if not ASSET_NAME_RE.match(name):
+            raise ValueError(f"Недопустимое имя ассета: {name!r} (буквы, цифры, _ и -)")
+        self._save({**self.assets, name: {"kind": kind, "file_id": file_id, **source}})
+
+    def seed(self, defaults):
+        """Добавляет известные заранее file_id ({имя: (тип, file_id)}), не трогая уже зарегистрированные"""
+        assets = self.assets
+        added = {name: {"kind": kind, "file_id": file_id}
+                 for name, (kind, file_id) in defaults.items() if name not in assets}
+        if added:
+            self._save({**assets, **added})
+
+    def forget_file_id(self, file_id):
+        """Telegram отверг file_id: убираем его, при следующей синхронизации файл загрузится заново"""
+        assets = self.assets
+        stale = [name for name, entry in assets.items() if entry.get("file_id") == file_id]
+        if stale:
+            self._save({**assets, **{name: {**assets[name], "file_id": None} for name in stale}})
+
+    def _find_by_hash(self, sha256):
+        for entry in self.assets.values():
+            if entry.get("sha256") == sha256 and entry.get("file_id"):
+                return entry
+        return None
+
+    async def sync(self, bot, chat_id):
+        """Загружает новые и изменённые файлы из assets_dir в чат chat_id. Возвращает число загрузок"""
+        if not self.assets_dir.is_dir():
+            return 0
+        uploaded = 0
+        for path in sorted(self.assets_dir.iterdir()):
+            kind = ASSET_EXTENSIONS.get(path.suffix.lower())
+            name = path.stem
+            if kind is None or not path.is_file() or not ASSET_NAME_RE.match(name):
+                continue
+            sha256 = await asyncio.to_thread(_sha256, path)
+            entry = self.assets.get(name)
+            if entry and entry.get("sha256") == sha256 and entry.get("file_id"):
+                continue
+            same = self._find_by_hash(sha256)
+            if same is not None and same["kind"] == kind:
+                self.register(name, kind, same["file_id"], sha256=sha256)
+                continue
+            try:
+                file_id = await self._upload(bot, chat_id, kind, path)
+            except Exception as e:
+                log.warning("Не удалось загрузить %s: %s", path.name, e)
+                continue
+            self.register(name, kind, file_id, sha256=sha256)
+            uploaded += 1
+            log.info("Ассет #%s загружен: %s", name, file_id)
+        return uploaded
+
+    @staticmethod
+    async def _upload(bot, chat_id, kind, path):
+        request_priority.set(MEDIA)
+        media = FSInputFile(path)
+        if kind == "audio":
+            return (await bot.send_audio(chat_id, audio=media)).audio.file_id
+        if kind == "sticker":
+            return (await bot.send_sticker(chat_id, sticker=media)).sticker.file_id
+        sent = await bot.send_animation(chat_id, animation=media)
+        return (sent.animation or sent.document).file_id
+
+
+class MediaSender:
+    """Отправка персонального подарка: аудио, стикер, GIF и текст.
+
+    Заглушки и file_id, которые Telegram уже отверг, отсеиваются до отправки,
+    а тип определяется по самому file_id (GIF, записанный как стикер, уйдёт
+    анимацией). Части отправляются одновременно, но стартуют с небольшим
+    шагом stagger, чтобы в чате они появились в исходном порядке.
+    Вместо file_id в подарке можно указать "#имя" из реестра assets.
+    """
+
+    def __init__(self, store, stagger=0.05, assets=None):
+        self.store = store
+        self.stagger = stagger
+        self.assets = assets
+        self.rejected = set(store.get_meta(REJECTED_META_KEY, []))
+
+    def is_usable(self, file_id):
+        return bool(file_id) and FILE_ID_RE.match(file_id) is not None and file_id not in self.rejected
+
+    def plan(self, user_data, audio_caption=DEFAULT_AUDIO_CAPTION):
+        """Список частей (тип, значение, доп. параметры) в порядке показа"""
+        items = []
+        audio = user_data.get("audio") or user_data.get("audio_file_id")
+        for kind, file_id in (("audio", audio), ("sticker", user_data.get("sticker")), ("animation", user_data.get("gif"))):
+            if self.assets is not None:
+                file_id = self.assets.resolve(file_id)
+            if not self.is_usable(file_id):
+                continue
+            kind = file_type(file_id) or kind
+            extra = {"caption": audio_caption} if kind == "audio" else {}
+            items.append((kind, file_id, extra))
+        if user_data.get("message"):
+            items.append(("text", user_data["message"], {}))
+        return items
+
+    async def send(self, message, items):
+        async def send_one(index, kind, value, extra):
+            request_priority.set(MEDIA)
+            await asyncio.sleep(index * self.stagger)
+            try:
+                if kind == "text":
+                    await message.answer(value, **extra)
+                elif kind == "audio":
+                    await message.answer_audio(audio=value, **extra)
+                elif kind == "sticker":
+                    await message.answer_sticker(sticker=value, **extra)
+                elif kind == "animation":
+                    await message.answer_animation(animation=value, **extra)
+            except TelegramBadRequest as e:
+                if kind == "text":
+                    raise
+                if not BAD_FILE_ID_RE.search(e.message):
+                    log.warning("Не удалось отправить %s %s: %s", kind, value, e.message)
+                    return
+                # Telegram не принял file_id — больше его не пробуем
+                log.warning("Telegram отверг file_id %s (%s): %s", value, kind, e.message)
+                self.rejected.add(value)
+                self.store.set_meta(REJECTED_META_KEY, sorted(self.rejected))
+                if self.assets is not None:
+                    self.assets.forget_file_id(value)
+
+        results = await asyncio.gather(
+            *(send_one(i, kind, value, extra) for i, (kind, value, extra) in enumerate(items)),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                log.error("Ошибка отправки подарка", exc_info=result)
+
+    async def send_media_and_message(self, message, user_data, audio_caption=DEFAULT_AUDIO_CAPTION):
+        await self.send(message, self.plan(user_data, audio_caption))
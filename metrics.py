@@ -0,0 +1,269 @@
+import bisect
+import logging
+import time
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import CallbackQuery, Message
+
+from router import unpack_callback
+
+log = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя — всё, что больше верхней границы
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (линейно внутри корзины)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class Registry:
+    """Счётчики, гистограммы и датчики (gauge) в памяти процесса.
+
+    Метрика адресуется именем и набором меток; датчики — функции, которые
+    вызываются в момент чтения и возвращают число или словарь {метка: число}.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, read, label=None):
+        self.gauges[name] = (read, label)
+
+    def timer(self, name, **labels):
+        return _Timer(self, name, labels)
+
+    # --- Вывод ---
+
+    def read_gauges(self):
+        for name, (read, label) in self.gauges.items():
+            try:
+                value = read()
+            except Exception:
+                log.exception("Не удалось прочитать датчик %s", name)
+                continue
+            if isinstance(value, dict):
+                for label_value, number in value.items():
+                    yield name, {label or "name": label_value}, number
+            else:
+                yield name, {}, value
+
+    def render_prometheus(self):
+        lines = []
+
+        def fmt_labels(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels) + "}"
+
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}_total{fmt_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{fmt_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{fmt_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{fmt_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{fmt_labels(labels)} {histogram.count}")
+        for name, labels, value in self.read_gauges():
+            lines.append(f"{name}{fmt_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    # Экранирование значения метки в текстовом формате Prometheus
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+# Общий реестр процесса
+REGISTRY = Registry()
+
+
+class HandlerLabels:
+    """Имя обработчика для метрик и трасс: действие кнопки, команда или тип сообщения.
+
+    callback_data и текст команды присылает клиент, поэтому как есть в метку
+    идут только известные боту действия (actions) и команды (commands, без
+    «/»), остальные — callback:unknown и command:unknown. Иначе любой
+    пользователь может наплодить сколько угодно рядов метрик. Коллекции
+    читаются при каждом вызове — их можно пополнять после создания.
+    """
+
+    def __init__(self, actions=(), commands=()):
+        self.actions = actions
+        self.commands = commands
+
+    def __call__(self, event):
+        if isinstance(event, CallbackQuery):
+            action, _ = unpack_callback(event.data)
+            return f"callback:{action if action in self.actions else 'unknown'}"
+        if isinstance(event, Message):
+            if event.text and event.text.startswith("/"):
+                command = event.text.split()[0].split("@")[0][1:]
+                return f"command:/{command}" if command in self.commands else "command:unknown"
+            return f"message:{event.content_type}"
+        return type(event).__name__
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время работы и ошибки обработчиков (подключается на dp.message и dp.callback_query)"""
+
+    def __init__(self, labels, registry=REGISTRY):
+        self.labels = labels
+        self.registry = registry
+
+    async def __call__(self, handler, event, data):
+        label = self.labels(event)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.registry.inc("bot_handler_errors", handler=label)
+            raise
+        finally:
+            self.registry.observe("bot_handler_seconds", time.perf_counter() - started, handler=label)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Вызовы Bot API: число, время, ошибки и 429 по методам"""
+
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            self.registry.inc("bot_api_throttled", method=name)
+            raise
+        except Exception:
+            self.registry.inc("bot_api_errors", method=name)
+            raise
+        finally:
+            self.registry.inc("bot_api_calls", method=name)
+            self.registry.observe("bot_api_seconds", time.perf_counter() - started, method=name)
+
+
+def render_summary(registry=REGISTRY, top=10):
+    """Короткая сводка для команды /stats"""
+
+    def ms(seconds):
+        return f"{seconds * 1000:.0f}"
+
+    def section(title, metric, label_name, errors_metric=None, extra_metric=None):
+        rows = [
+            (dict(labels).get(label_name, "-"), histogram)
+            for (name, labels), histogram in registry.histograms.items()
+            if name == metric
+        ]
+        if not rows:
+            return []
+        rows.sort(key=lambda row: row[1].count, reverse=True)
+        lines = [title]
+        for label, histogram in rows[:top]:
+            line = f"• {label}: {histogram.count} шт, p50 {ms(histogram.quantile(0.5))} мс, p99 {ms(histogram.quantile(0.99))} мс"
+            if errors_metric:
+                errors = registry.counters.get(registry._key(errors_metric, {label_name: label}), 0)
+                if errors:
+                    line += f", ошибок {errors}"
+            if extra_metric:
+                throttled = registry.counters.get(registry._key(extra_metric, {label_name: label}), 0)
+                if throttled:
+                    line += f", 429: {throttled}"
+            lines.append(line)
+        return lines + [""]
+
+    lines = ["📊 Статистика\n"]
+    lines += section("Обработчики:", "bot_handler_seconds", "handler", "bot_handler_errors")
+    lines += section("Bot API:", "bot_api_seconds", "method", "bot_api_errors", "bot_api_throttled")
+    lines += section("Хранилище:", "storage_seconds", "operation")
+    gauges = {}
+    for name, labels, value in registry.read_gauges():
+        gauges.setdefault(name, []).append((labels, value))
+    if gauges:
+        lines.append("Очереди и состояние:")
+        for name, rows in gauges.items():
+            if len(rows) == 1 and not rows[0][0]:
+                lines.append(f"• {name}: {rows[0][1]}")
+                continue
+            # Датчик с метками — сумма и разбивка, как в /metrics
+            parts = ", ".join(
+                f"{', '.join(f'{k}={v}' for k, v in labels.items())}: {value}" for labels, value in rows
+            )
+            lines.append(f"• {name}: {sum(value for _, value in rows)} ({parts})")
+    return "\n".join(lines).strip()
+
+
+async def start_metrics_server(host, port, path="/metrics", registry=REGISTRY):
+    """Отдаёт метрики в текстовом формате Prometheus; возвращает AppRunner для остановки"""
+
+    async def handle(request):
+        return web.Response(text=registry.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get(path, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,79 @@
+import asyncio
+
+from aiogram import BaseMiddleware
+
+
+class PerUserSerializer(BaseMiddleware):
+    """Обновления одного пользователя обрабатываются строго по очереди.
+
+    Разные пользователи по-прежнему обрабатываются параллельно: у каждого
+    свой asyncio.Lock, который удаляется, когда его никто не ждёт.
+    Подключается как outer-middleware на dp.update.
+    """
+
+    def __init__(self):
+        self._locks = {}
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user.id]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class CallbackDeduplicator(BaseMiddleware):
+    """Схлопывает повторные нажатия одной и той же кнопки.
+
+    Пока обработчик нажатия (user_id, callback_data) работает, повторные
+    такие же нажатия получают только call.answer() и дальше не идут; то же —
+    в течение window секунд после его завершения. Подключается как
+    outer-middleware на dp.update раньше PerUserSerializer, чтобы дубли
+    не вставали в очередь пользователя.
+    """
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self._inflight = set()
+        self._recent = {}
+
+    def _is_recent(self, key, now):
+        # Чистим устаревшие записи: словарь упорядочен по времени завершения
+        while self._recent:
+            oldest_key, finished_at = next(iter(self._recent.items()))
+            if now - finished_at < self.window:
+                break
+            del self._recent[oldest_key]
+        return key in self._recent
+
+    async def __call__(self, handler, event, data):
+        call = event.callback_query
+        if call is None:
+            return await handler(event, data)
+
+        key = (call.from_user.id, call.data)
+        now = asyncio.get_running_loop().time()
+        if key in self._inflight or self._is_recent(key, now):
+            await call.answer()
+            return None
+
+        self._inflight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._inflight.discard(key)
+            self._recent.pop(key, None)
+            self._recent[key] = asyncio.get_running_loop().time()
@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+from collections import deque
+
+from aiohttp import FormData
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+
+from templates import FrozenKeyboard
+
+# Классы приоритета исходящих запросов: чем меньше число, тем раньше уходит запрос
+INTERACTIVE = 0  # ответы на команды и нажатия кнопок
+MEDIA = 1        # персональные подарки
+BROADCAST = 2    # массовые рассылки
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", MEDIA: "media", BROADCAST: "broadcast"}
+
+# Приоритет запросов текущей задачи; по умолчанию — интерактивный
+request_priority = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """AiohttpSession с общим пулом keep-alive соединений к Bot API.
+
+    Готовые клавиатуры (templates.FrozenKeyboard) не сериализуются заново
+    на каждый запрос: берётся JSON, подготовленный при первой отправке.
+    """
+
+    def __init__(self, limit=100, keepalive_timeout=60, **kwargs):
+        super().__init__(limit=limit, **kwargs)
+        self._connector_init.update(
+            keepalive_timeout=keepalive_timeout,  # держим соединения открытыми между запросами
+            limit_per_host=limit,                 # все запросы идут на один хост api.telegram.org
+        )
+
+    def build_form_data(self, bot, method):
+        markup = getattr(method, "reply_markup", None)
+        if not isinstance(markup, FrozenKeyboard):
+            return super().build_form_data(bot, method)
+        form = FormData(quote_fields=False)
+        files = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if value:
+                form.add_field(key, value)
+        form.add_field("reply_markup", markup.serialized)
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
+
+
+class _Request:
+    __slots__ = ("priority", "chat_id", "make_request", "bot", "method", "future")
+
+    def __init__(self, priority, chat_id, make_request, bot, method, future):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.future = future
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Очередь исходящих запросов к Bot API с приоритетами.
+
+    Подключается middleware сессии бота (bot.session.middleware(...)), так что
+    через неё проходят все вызовы. Запросы выполняются пулом из workers задач,
+    первым — запрос с наивысшим приоритетом (request_priority). Воркеров
+    должно быть столько же, сколько соединений в пуле сессии (limit
+    TunedAiohttpSession): меньше — и очередь станет узким местом перед
+    свободными соединениями. Рассылки
+    занимают не больше workers - reserved воркеров, так что ответам
+    пользователям всегда остаётся место.
+
+    В пределах одного чата запросы уходят в порядке постановки: следующий
+    стартует только после ответа на предыдущий и ещё chat_gap секунд спустя.
+    getUpdates идёт мимо очереди — это долгий запрос поллинга.
+    """
+
+    def __init__(self, workers=100, reserved=4, chat_gap=0.05):
+        self.workers = workers
+        self.bulk_limit = max(1, workers - reserved)
+        self.chat_gap = chat_gap
+        self._heap = []
+        self._seq = itertools.count()
+        self._chats = {}
+        self._bulk_inflight = 0
+        self._cond = None
+        self._tasks = []
+        self._pushes = set()
+
+    def depth(self):
+        """Сколько запросов ждёт отправки, по классам приоритета"""
+        counts = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        for _, _, request in self._heap:
+            counts[PRIORITY_NAMES[request.priority]] += 1
+        for pending in self._chats.values():
+            for request in pending:
+                counts[PRIORITY_NAMES[request.priority]] += 1
+        return counts
+
+    def _start(self):
+        self._cond = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        tasks = self._tasks + list(self._pushes)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+        if not self._tasks:
+            self._start()
+
+        loop = asyncio.get_running_loop()
+        chat_id = getattr(method, "chat_id", None)
+        request = _Request(request_priority.get(), chat_id, make_request, bot, method, loop.create_future())
+        if chat_id is not None and chat_id in self._chats:
+            # В этом чате уже есть запрос перед нами — ждём своей очереди
+            self._chats[chat_id].append(request)
+        else:
+            if chat_id is not None:
+                self._chats[chat_id] = deque()
+            await self._push(request)
+        return await request.future
+
+    async def _push(self, request):
+        async with self._cond:
+            heapq.heappush(self._heap, (request.priority, next(self._seq), request))
+            self._cond.notify()
+
+    def _release_chat(self, chat_id):
+        pending = self._chats.get(chat_id)
+        if pending is None:
+            return
+        if pending:
+            # Держим ссылку: иначе задачу может собрать сборщик мусора, а close() её не отменит
+            task = asyncio.create_task(self._push(pending.popleft()))
+            self._pushes.add(task)
+            task.add_done_callback(self._pushes.discard)
+        else:
+            del self._chats[chat_id]
+
+    def _can_pop(self):
+        if not self._heap:
+            return False
+        # Вверху кучи рассылка — значит, ничего срочнее нет; ограничиваем только их число
+        return self._heap[0][0] != BROADCAST or self._bulk_inflight < self.bulk_limit
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(self._can_pop)
+                _, _, request = heapq.heappop(self._heap)
+                if request.priority == BROADCAST:
+                    self._bulk_inflight += 1
+
+            try:
+                if request.future.done():
+                    continue  # вызывающий уже не ждёт (отменён)
+                try:
+                    result = await request.make_request(request.bot, request.method)
+                except asyncio.CancelledError:
+                    request.future.cancel()
+                    raise
+                except Exception as e:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                else:
+                    if not request.future.done():
+                        request.future.set_result(result)
+            finally:
+                if request.chat_id is not None:
+                    # Пока запрос не завершён, следующий в тот же чат не стартует — иначе порядок не гарантирован
+                    loop.call_later(self.chat_gap, self._release_chat, request.chat_id)
+                if request.priority == BROADCAST:
+                    async with self._cond:
+                        self._bulk_inflight -= 1
+                        self._cond.notify_all()
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+from pathlib import Path
+
+from media import ASSET_NAME_RE, ASSET_PREFIX, FILE_ID_RE, file_type
+
+log = logging.getLogger(__name__)
+
+# Поля подарка, в которых лежат file_id, и ожидаемый тип файла
+MEDIA_FIELDS = {"audio": "audio", "audio_file_id": "audio", "sticker": "sticker", "gif": "animation"}
+
+
+class PersonalizationIndex:
+    """Скомпилированные персональные подарки: поиск по user_id, затем по username без учёта регистра"""
+
+    def __init__(self, by_id, by_username, warnings):
+        self.by_id = by_id
+        self.by_username = by_username
+        self.warnings = warnings
+
+    def lookup(self, user_id, username=None):
+        payload = self.by_id.get(user_id)
+        if payload is None and username:
+            payload = self.by_username.get(username.casefold())
+        return payload
+
+    def __len__(self):
+        return len(self.by_id) + len(self.by_username)
+
+
+def compile_index(raw):
+    """Проверяет содержимое personalization.json и строит из него индекс.
+
+    Битые записи (без текста, с нечисловым id) — ошибка. Вместо file_id можно
+    указать "#имя" из реестра медиа. Заглушки вместо file_id выкидываются, а они, повторы и несовпадение типа попадают в warnings.
+    """
+    warnings = []
+    seen_file_ids = {}
+
+    def clean(where, payload):
+        if not isinstance(payload, dict) or not isinstance(payload.get("message"), str):
+            raise ValueError(f"{where}: нет текста подарка (message)")
+        payload = dict(payload)
+        for field, expected in MEDIA_FIELDS.items():
+            if field not in payload:
+                continue
+            file_id = payload[field]
+            if isinstance(file_id, str) and file_id.startswith(ASSET_PREFIX):
+                # Ссылка на реестр медиа: file_id подставится при отправке
+                if not ASSET_NAME_RE.match(file_id[len(ASSET_PREFIX):]):
+                    warnings.append(f"{where}: {field} — недопустимое имя ассета {file_id!r}")
+                    del payload[field]
+                continue
+            if not file_id or not FILE_ID_RE.match(file_id):
+                warnings.append(f"{where}: {field} — заглушка вместо file_id ({file_id!r}), не отправляется")
+                del payload[field]
+                continue
+            detected = file_type(file_id)
+            if detected and detected != expected:
+                warnings.append(f"{where}: {field} на самом деле {detected}")
+            seen_file_ids.setdefault(file_id, []).append(where)
+        return payload
+
+    by_id = {}
+    for key, payload in raw.get("by_id", {}).items():
+        try:
+            user_id = int(key)
+        except ValueError:
+            raise ValueError(f"by_id: {key!r} — не числовой user_id")
+        by_id[user_id] = clean(f"id {key}", payload)
+
+    by_username = {}
+    for username, payload in raw.get("by_username", {}).items():
+        key = username.lstrip("@").casefold()
+        if key in by_username:
+            warnings.append(f"@{username}: повтор (username сравниваются без учёта регистра), берётся последний")
+        by_username[key] = clean(f"@{username}", payload)
+
+    for file_id, places in seen_file_ids.items():
+        if len(places) > 1:
+            warnings.append(f"file_id {file_id[:12]}… повторяется: {', '.join(places)}")
+    return PersonalizationIndex(by_id, by_username, warnings)
+
+
+class Personalization:
+    """Персональные подарки из файла с перезагрузкой на лету.
+
+    watch() раз в reload_interval секунд проверяет время изменения файла и
+    при изменении собирает новый индекс. Индекс подменяется одной операцией,
+    поэтому уже идущие обработчики дорабатывают со старым, а новые берут
+    новый. Если файл сломан, остаётся предыдущий индекс.
+    """
+
+    def __init__(self, path, reload_interval=5):
+        self.path = Path(path)
+        self.reload_interval = reload_interval
+        self.index = PersonalizationIndex({}, {}, [])
+        self._mtime = None
+
+    def _read(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            return compile_index(json.load(f))
+
+    def load(self):
+        try:
+            mtime = self.path.stat().st_mtime
+            index = self._read()
+        except (OSError, ValueError) as e:
+            log.error("Не удалось загрузить %s: %s", self.path.name, e)
+            return False
+        self._apply(index, mtime)
+        return True
+
+    def _apply(self, index, mtime):
+        self.index = index
+        self._mtime = mtime
+        for warning in index.warnings:
+            log.warning("%s: %s", self.path.name, warning)
+        log.info("Персональных подарков загружено: %d", len(index))
+
+    def lookup(self, user_id, username=None):
+        return self.index.lookup(user_id, username)
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError:
+                continue
+            if mtime == self._mtime:
+                continue
+            try:
+                index = await asyncio.to_thread(self._read)
+            except (OSError, ValueError) as e:
+                log.error("Не удалось перезагрузить %s, остаётся прежний: %s", self.path.name, e)
+                self._mtime = mtime
+                continue
+            self._apply(index, mtime)
@@ -0,0 +1,78 @@
+from aiogram import types
+
+# Версия формата callback_data с аргументами: "v1:действие:арг1:арг2"
+CALLBACK_VERSION = "v1"
+CALLBACK_SEPARATOR = ":"
+
+
+def pack_callback(action, *args):
+    """Собирает callback_data. Без аргументов — просто имя действия, как у старых кнопок"""
+    if not args:
+        return action
+    data = CALLBACK_SEPARATOR.join((CALLBACK_VERSION, action, *map(str, args)))
+    if len(data.encode("utf-8")) > 64:
+        raise ValueError(f"callback_data длиннее 64 байт: {data}")
+    return data
+
+
+def unpack_callback(data):
+    """callback_data -> (действие, [аргументы])"""
+    if not data:
+        return "", []
+    if data.startswith(CALLBACK_VERSION + CALLBACK_SEPARATOR):
+        _, action, *args = data.split(CALLBACK_SEPARATOR)
+        return action, args
+    return data, []
+
+
+class CallbackRouter:
+    """Маршрутизация нажатий inline-кнопок по действию из callback_data.
+
+    Вместо цепочки фильтров — один поиск в словаре, так что цена обработки
+    не растёт с числом кнопок. Аргументы из callback_data передаются
+    в обработчик позиционно после call.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+    @property
+    def actions(self):
+        """Зарегистрированные действия (живое представление — видит и добавленные позже)"""
+        return self._handlers.keys()
+
+    def action(self, name):
+        def register(handler):
+            if name in self._handlers:
+                raise ValueError(f"Действие {name} уже зарегистрировано")
+            self._handlers[name] = handler
+            return handler
+        return register
+
+    async def dispatch(self, call: types.CallbackQuery):
+        action, args = unpack_callback(call.data)
+        handler = self._handlers.get(action)
+        if handler is None:
+            # Кнопка от старой версии бота — просто убираем «часики»
+            await call.answer()
+            return
+        await handler(call, *args)
+
+
+class ContentRouter:
+    """Маршрутизация сообщений по типу содержимого (аудио, стикер, GIF ...)"""
+
+    def __init__(self):
+        self._handlers = {}
+
+    def content_type(self, content_type):
+        def register(handler):
+            self._handlers[content_type] = handler
+            return handler
+        return register
+
+    def accepts(self, message: types.Message):
+        return message.content_type in self._handlers
+
+    async def dispatch(self, message: types.Message):
+        await self._handlers[message.content_type](message)
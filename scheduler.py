@@ -0,0 +1,170 @@
+import asyncio
+import datetime
+import heapq
+import inspect
+import logging
+import uuid
+
+from logs import trace
+
+# Каждое задание — отдельный ключ служебных данных хранилища: JOB_META_PREFIX + id.
+# Воркеры меняют только свои ключи и не перетирают список друг друга
+JOB_META_PREFIX = "scheduled_jobs:"
+# Раньше все задания лежали одним списком под этим ключом
+LEGACY_JOBS_META_KEY = "scheduled_jobs"
+
+# Даже без новых заданий просыпаемся хотя бы раз в час — на случай перевода часов
+MAX_SLEEP = 3600
+
+log = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, job_id, run_at, action, args=None):
+        self.id = job_id
+        self.run_at = run_at
+        self.action = action
+        self.args = args or {}
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "run_at": self.run_at.isoformat(),
+            "action": self.action,
+            "args": self.args,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["id"], datetime.datetime.fromisoformat(data["run_at"]), data["action"], data.get("args"))
+
+    def __str__(self):
+        args = " ".join(f"{k}={v}" for k, v in self.args.items())
+        return f"{self.id} — {self.run_at:%Y-%m-%d %H:%M} {self.action} {args}".rstrip()
+
+
+class Scheduler:
+    """Планировщик заданий по времени.
+
+    Задания лежат в куче по времени запуска, фоновая задача спит ровно до
+    ближайшего. Задания хранятся в хранилище участников (set_meta, по ключу
+    на задание), поэтому переживают перезапуск; пропущенные за время простоя задания
+    запускаются сразу после старта. actions — словарь
+    "имя действия" -> async-функция, в которую передаются args задания.
+    """
+
+    def __init__(self, store, actions):
+        self.store = store
+        self.actions = actions
+        self._jobs = {}
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._running = set()
+        self._executing = {}
+
+    def load(self):
+        """Читает задания из хранилища; с несколькими воркерами — перед показом и отменой"""
+        self._jobs.clear()
+        self._heap.clear()
+        for data in self.store.get_meta_items(JOB_META_PREFIX).values():
+            job = Job.from_dict(data)
+            if job.id in self._executing:
+                # Уже выполняется — второй раз в кучу не ставим
+                self._jobs[job.id] = self._executing[job.id]
+                continue
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (job.run_at, job.id))
+        self._wakeup.set()
+
+    def migrate_legacy(self):
+        """Раскладывает старый общий список заданий по ключам. Только у ведущего:
+        иначе воркер вернёт ключ задания, которое ведущий уже выполнил и удалил"""
+        legacy = self.store.get_meta(LEGACY_JOBS_META_KEY)
+        if legacy is None:
+            return
+        for data in legacy:
+            self.store.set_meta(JOB_META_PREFIX + data["id"], data)
+        self.store.delete_meta(LEGACY_JOBS_META_KEY)
+
+    # --- API для администратора ---
+
+    def list(self):
+        return sorted(self._jobs.values(), key=lambda job: job.run_at)
+
+    def add(self, run_at, action, args=None, job_id=None):
+        if action not in self.actions:
+            raise ValueError(f"Неизвестное действие: {action}")
+        # Проверяем аргументы сейчас, а не когда задание сработает и упадёт с TypeError
+        args = args or {}
+        if "job_id" in args:
+            raise ValueError("job_id задаётся планировщиком")
+        try:
+            inspect.signature(self.actions[action]).bind(job_id=None, **args)
+        except TypeError as e:
+            raise ValueError(f"Аргументы для {action}: {e}") from None
+        job = Job(job_id or uuid.uuid4().hex[:8], run_at, action, args)
+        self._jobs[job.id] = job
+        heapq.heappush(self._heap, (job.run_at, job.id))
+        self.store.set_meta(JOB_META_PREFIX + job.id, job.to_dict())
+        self._wakeup.set()  # возможно, новое задание раньше текущего ближайшего
+        return job
+
+    def cancel(self, job_id):
+        # Из кучи не удаляем: запись без задания просто пропустится при извлечении
+        if self._jobs.pop(job_id, None) is None:
+            return False
+        self.store.delete_meta(JOB_META_PREFIX + job_id)
+        self._wakeup.set()
+        return True
+
+    # --- Цикл ---
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._next_delay()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay or MAX_SLEEP, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            run_at, job_id = heapq.heappop(self._heap)
+            job = self._jobs.get(job_id)
+            if job is None or job.run_at != run_at:
+                continue  # отменено или перенесено
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def stop(self):
+        """Отменяет идущие задания: они остаются в списке и после перезапуска
+        запускаются снова (рассылки — с контрольной точки)"""
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _next_delay(self):
+        while self._heap:
+            run_at, job_id = self._heap[0]
+            job = self._jobs.get(job_id)
+            if job is None or job.run_at != run_at:
+                heapq.heappop(self._heap)
+                continue
+            return (run_at - datetime.datetime.now()).total_seconds()
+        return None
+
+    async def _execute(self, job):
+        log.info("Запускаю задание %s", job)
+        self._executing[job.id] = job
+        try:
+            with trace("job", f"job-{job.id}", action=job.action):
+                await self.actions[job.action](job_id=job.id, **job.args)
+        except Exception:
+            log.exception("Ошибка в задании %s", job.id)
+        finally:
+            self._executing.pop(job.id, None)
+        # Задание выполнено — убираем из хранилища только его ключ
+        if self._jobs.get(job.id) is job:
+            del self._jobs[job.id]
+        self.store.delete_meta(JOB_META_PREFIX + job.id)
@@ -0,0 +1,805 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+from locks import FileLock
+from logs import span
+from metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """Пишет JSON во временный файл и атомарно подменяет им path.
+
+    При падении посреди записи на диске остаётся либо старый, либо новый файл,
+    но никогда не обрезанный.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+
+
+def _fsync_dir(directory):
+    # На Windows каталоги так не открыть — там rename и так надёжен
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class MetaFile:
+    """Служебные данные бота (задания планировщика и т.п.) рядом с файлом участников"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self):
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except json.JSONDecodeError:
+                pass
+        return {}
+
+    def save(self, meta):
+        write_json_atomic(self.path, meta, indent=2)
+
+
+class JsonFileBackend:
+    """Хранит всех участников одним JSON-файлом (исходный формат participants.json)"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta_file = MetaFile(self.path.with_suffix(".meta.json"))
+        self.lock = None
+
+    def load_meta(self):
+        return self.meta_file.load()
+
+    def persist_meta(self, meta, changed_keys):
+        self.meta_file.save(meta)
+
+    def load(self):
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+                if content:  # Если файл не пустой
+                    try:
+                        return json.loads(content)
+                    except json.JSONDecodeError:
+                        return []  # Если ошибка — возвращаем пустой список
+        return []
+
+    def persist(self, changed, snapshot):
+        # Формат файла — один список, поэтому переписываем его целиком
+        write_json_atomic(self.path, snapshot(), indent=2)
+
+    def close(self):
+        if self.lock is not None:
+            self.lock.release()
+
+
+class JournalBackend:
+    """Снимок + журнал изменений (JSON lines).
+
+    Каждое изменение дописывается в журнал одной короткой строкой, fsync
+    делается один раз на пачку. При запуске журнал проигрывается поверх
+    снимка. Когда в журнале набирается compact_after строк, всё состояние
+    пишется в новый снимок (атомарная подмена файла), а журнал обнуляется.
+    Снимок — тот же список, что и в participants.json.
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, compact_after=1000):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = Path(journal_path) if journal_path else self.snapshot_path.with_suffix(".journal")
+        self.compact_after = compact_after
+        self.meta_file = MetaFile(self.snapshot_path.with_suffix(".meta.json"))
+        self._journal = None
+        self._lines = 0
+        self.lock = None
+
+    def load_meta(self):
+        return self.meta_file.load()
+
+    def persist_meta(self, meta, changed_keys):
+        # Служебные данные меняются редко — им журнал не нужен
+        self.meta_file.save(meta)
+
+    @property
+    def needs_snapshot(self):
+        return self._lines >= self.compact_after
+
+    @property
+    def journal_lines(self):
+        return self._lines
+
+    def load(self):
+        records = {}
+        for record in JsonFileBackend(self.snapshot_path).load():
+            if record.get("user_id") is not None:
+                records[record["user_id"]] = record
+
+        self._lines = 0
+        if self.journal_path.exists():
+            good_size = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("нет конца строки")
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Недописанная строка после падения — дальше журнал не читаем
+                        break
+                    self._apply(records, entry)
+                    self._lines += 1
+                    good_size += len(line)
+            if good_size < self.journal_path.stat().st_size:
+                # Отрезаем хвост, чтобы новые записи не склеились с обрывком
+                os.truncate(self.journal_path, good_size)
+        return list(records.values())
+
+    @staticmethod
+    def _apply(records, entry):
+        op = entry.get("op")
+        if op == "put":
+            record = entry["r"]
+            records[record["user_id"]] = record
+        elif op == "reset_gifts":
+            for record in records.values():
+                record["gift_requested"] = False
+
+    def _append(self, entries):
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        for entry in entries:
+            self._journal.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._lines += len(entries)
+
+    def reset_gifts(self):
+        self._append([{"op": "reset_gifts"}])
+
+    def persist(self, changed, snapshot):
+        # Решаем здесь, после reset_gifts этой же пачки: он тоже дописал строку в журнал
+        if self.needs_snapshot:
+            self.compact(snapshot())
+            return
+        if changed:
+            self._append([{"op": "put", "r": record} for record in changed])
+
+    def compact(self, records):
+        write_json_atomic(self.snapshot_path, records, separators=(",", ":"))
+        # Снимок уже на диске — журнал можно обнулить
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._lines = 0
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self.lock is not None:
+            self.lock.release()
+
+
+class SqliteBackend:
+    """SQLite в режиме WAL: каждая запись — строка таблицы participants.
+
+    user_id, username, status и gift_requested лежат в отдельных
+    индексированных колонках, остальные поля — JSON в колонке data.
+    """
+
+    # Поля записи, которые хранятся в собственных колонках
+    COLUMNS = ("user_id", "username", "status", "gift_requested")
+
+    def __init__(self, path):
+        self.path = Path(path)
+        # Пишем из потока to_thread, поэтому соединение не привязываем к потоку;
+        # одновременную запись исключает блокировка в ParticipantStore
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS participants (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    status TEXT,
+                    gift_requested INTEGER,
+                    data TEXT NOT NULL DEFAULT '{}'
+                );
+                CREATE INDEX IF NOT EXISTS idx_participants_status ON participants(status);
+                CREATE INDEX IF NOT EXISTS idx_participants_gift ON participants(gift_requested);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            """)
+
+    @classmethod
+    def _to_row(cls, record):
+        data = {k: v for k, v in record.items() if k not in cls.COLUMNS}
+        gift = record.get("gift_requested")
+        return (
+            record["user_id"],
+            record.get("username"),
+            record.get("status"),
+            None if gift is None else int(bool(gift)),
+            json.dumps(data, ensure_ascii=False, separators=(",", ":")),
+        )
+
+    @staticmethod
+    def _from_row(row):
+        user_id, username, status, gift, data = row
+        record = {"user_id": user_id}
+        if username is not None:
+            record["username"] = username
+        if status is not None:
+            record["status"] = status
+        if gift is not None:
+            record["gift_requested"] = bool(gift)
+        record.update(json.loads(data))
+        return record
+
+    def _select(self, where="", params=()):
+        query = "SELECT user_id, username, status, gift_requested, data FROM participants " + where
+        return [self._from_row(row) for row in self.conn.execute(query, params)]
+
+    def load(self):
+        return self._select()
+
+    def persist(self, changed, snapshot):
+        if not changed:
+            return
+        with self.conn:
+            self.conn.executemany(
+                """INSERT INTO participants (user_id, username, status, gift_requested, data)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(user_id) DO UPDATE SET
+                       username = excluded.username,
+                       status = excluded.status,
+                       gift_requested = excluded.gift_requested,
+                       data = excluded.data""",
+                [self._to_row(record) for record in changed],
+            )
+
+    def reset_gifts(self):
+        with self.conn:
+            self.conn.execute("UPDATE participants SET gift_requested = 0")
+
+    def load_meta(self):
+        return {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM meta")}
+
+    def persist_meta(self, meta, changed_keys):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [(key, json.dumps(meta[key], ensure_ascii=False)) for key in changed_keys if key in meta],
+            )
+            self.conn.executemany(
+                "DELETE FROM meta WHERE key = ?",
+                [(key,) for key in changed_keys if key not in meta],
+            )
+
+    def eligible_for_reminder(self):
+        # Все, кто не отказался (в том числе без статуса)
+        return self._select("WHERE status IS NULL OR status != 'declined'")
+
+    def close(self):
+        self.conn.close()
+
+
+class SharedSqliteBackend(SqliteBackend):
+    """SQLite, общий для нескольких процессов-воркеров.
+
+    Каждое сохранение — отдельная транзакция BEGIN IMMEDIATE: запись
+    читается, сверяется версия, поля дописываются и строка пишется с
+    версией + 1. Так два воркера не перетирают изменения друг друга.
+    Каждая изменённая строка получает следующий номер seq, по нему воркер
+    дочитывает чужие изменения; что они были, видно по PRAGMA data_version
+    без обращения к таблице.
+
+    Запись идёт соединением conn из потока (to_thread), чтение из event
+    loop — отдельным соединением reader: в WAL читатель не ждёт блокировку
+    записи и не видит незакоммиченных строк. С одним соединением event loop
+    стоял бы на его мьютексе, пока транзакция в потоке ждёт другой воркер.
+    """
+
+    shared = True
+
+    def __init__(self, path, busy_timeout=30.0):
+        super().__init__(path)
+        self.conn.close()
+        # isolation_level=None — транзакциями управляем сами (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(self.path, timeout=busy_timeout, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._begin()
+        try:
+            # Колонки смотрим уже под блокировкой: воркеры стартуют одновременно
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(participants)")}
+            if "version" not in columns:
+                self.conn.execute("ALTER TABLE participants ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            if "seq" not in columns:
+                self.conn.execute("ALTER TABLE participants ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_participants_seq ON participants(seq)")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        self.reader = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        self._data_version = None
+
+    def _begin(self):
+        # Сразу берём блокировку записи, иначе две транзакции, начавшие с чтения, упрутся друг в друга
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def changed(self):
+        """Были ли коммиты других процессов с прошлой проверки"""
+        data_version = self.reader.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return False
+        self._data_version = data_version
+        return True
+
+    def changes_since(self, seq):
+        """[(запись, версия)] со строками новее seq и новый максимальный seq"""
+        rows = self.reader.execute(
+            "SELECT user_id, username, status, gift_requested, data, version, seq FROM participants"
+            " WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        changes = [(self._from_row(row[:5]), row[5]) for row in rows]
+        return changes, max([seq] + [row[6] for row in rows])
+
+    def load_meta(self):
+        return {key: json.loads(value) for key, value in self.reader.execute("SELECT key, value FROM meta")}
+
+    def save_versioned(self, user_id, fields, expected_version=None):
+        """Дописывает fields в запись user_id. Возвращает (запись, версия) или бросает VersionConflict"""
+        self._begin()
+        try:
+            row = self.conn.execute(
+                "SELECT user_id, username, status, gift_requested, data, version FROM participants WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            version = row[5] if row else 0
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(user_id)
+            record = self._from_row(row[:5]) if row else {}
+            record.update(fields)
+            version += 1
+            self.conn.execute(
+                """INSERT INTO participants (user_id, username, status, gift_requested, data, version, seq)
+                   VALUES (?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM participants))
+                   ON CONFLICT(user_id) DO UPDATE SET
+                       username = excluded.username,
+                       status = excluded.status,
+                       gift_requested = excluded.gift_requested,
+                       data = excluded.data,
+                       version = excluded.version,
+                       seq = excluded.seq""",
+                (*self._to_row(record), version),
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return record, version
+
+    def persist(self, changed, snapshot):
+        # Всё пишется сразу в save_versioned; сюда изменения не копятся
+        pass
+
+    def reset_gifts(self):
+        self._begin()
+        try:
+            self.conn.execute(
+                "UPDATE participants SET gift_requested = 0, version = version + 1,"
+                " seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM participants)"
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def persist_meta(self, meta, changed_keys):
+        self._begin()
+        try:
+            for key in changed_keys:
+                if key in meta:
+                    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                      (key, json.dumps(meta[key], ensure_ascii=False)))
+                else:
+                    self.conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        self.reader.close()
+        super().close()
+
+
+def migrate_json_to_sqlite(json_path, db_path):
+    """Одноразовый перенос participants.json в SQLite. Возвращает число записей"""
+    records = [r for r in JsonFileBackend(json_path).load() if r.get("user_id") is not None]
+    backend = SqliteBackend(db_path)
+    try:
+        backend.persist(records, lambda: records)
+    finally:
+        backend.close()
+    return len(records)
+
+
+def make_backend(kind, participants_file, shared=False):
+    """Создаёт хранилище по имени из настройки STORAGE_BACKEND.
+
+    shared=True — несколько процессов-воркеров пишут в одно хранилище; так умеет только sqlite.
+    Файловые хранилища берут блокировку, чтобы второй процесс не испортил файл.
+    """
+    if kind == "sqlite":
+        path = Path(participants_file).with_suffix(".db")
+        return SharedSqliteBackend(path) if shared else SqliteBackend(path)
+    if shared:
+        raise ValueError(f"Хранилище {kind} не годится для нескольких воркеров — нужен STORAGE_BACKEND=sqlite")
+    if kind == "json":
+        backend = JsonFileBackend(participants_file)
+    elif kind == "journal":
+        backend = JournalBackend(participants_file)
+    else:
+        raise ValueError(f"Неизвестное хранилище: {kind}")
+    lock = FileLock(Path(participants_file).with_suffix(".lock"))
+    if not lock.acquire():
+        raise RuntimeError(f"{Path(participants_file).name} уже открыт другим процессом бота")
+    backend.lock = lock
+    return backend
+
+
+class VersionConflict(Exception):
+    """Запись изменилась с момента чтения — save() с expected_version отклонён"""
+
+
+class ParticipantStore:
+    """Участники в памяти: словарь по user_id плюс индекс по status.
+
+    Файл читается один раз при запуске, изменения копятся в памяти и
+    сбрасываются на диск фоновой задачей не чаще раза в flush_delay секунд.
+    Записи, которые возвращает стор, менять напрямую нельзя — только через save().
+
+    У каждой записи есть номер версии (растёт при каждом save). Если между
+    чтением и записью есть await, передайте в save() версию, прочитанную
+    вместе с записью: при расхождении будет VersionConflict, а не тихая
+    перезапись чужих изменений.
+
+    С общим хранилищем (backend.shared, несколько воркеров) asave() пишет
+    сразу, сверяя версию в транзакции, а перед чтением стор дочитывает чужие
+    изменения. Транзакции SQLite идут в потоке (to_thread), чтобы ожидание
+    блокировки базы за другим воркером не останавливало event loop.
+    """
+
+    def __init__(self, backend, flush_delay=1.0):
+        self.backend = backend
+        self.flush_delay = flush_delay
+        self.shared = getattr(backend, "shared", False)
+        self._seq = -1
+        self._by_id = {}
+        self._by_status = {}
+        self._versions = {}
+        self._dirty = set()
+        self._pending_reset = False
+        self._meta = {}
+        self._dirty_meta = set()
+        self._flush_task = None
+        self._write_lock = None
+
+    def load(self):
+        with REGISTRY.timer("storage_seconds", operation="load"):
+            self._load()
+
+    def _load(self):
+        self._by_id.clear()
+        self._by_status.clear()
+        self._versions.clear()
+        if self.shared:
+            self._seq = -1
+            self.backend.changed()
+            self._sync_records()
+            self._meta = self.backend.load_meta()
+            return
+        for record in self.backend.load():
+            user_id = record.get("user_id")
+            if user_id is None:
+                continue
+            self._by_id[user_id] = record
+            self._index(record)
+        self._meta = self.backend.load_meta()
+        self._dirty_meta.clear()
+
+    # --- Общее хранилище: чужие изменения ---
+
+    def _sync(self):
+        """Дочитывает изменения других воркеров (один PRAGMA, если их не было)"""
+        if not self.shared or not self.backend.changed():
+            return
+        with span("storage.sync"):
+            self._sync_records()
+            meta = self.backend.load_meta()
+            # Свои ещё не записанные изменения поверх прочитанного
+            for key in self._dirty_meta:
+                if key in self._meta:
+                    meta[key] = self._meta[key]
+                else:
+                    meta.pop(key, None)
+            self._meta = meta
+
+    def _sync_records(self):
+        changes, self._seq = self.backend.changes_since(self._seq)
+        for record, version in changes:
+            self._apply(record, version)
+
+    def _apply(self, record, version):
+        old = self._by_id.get(record["user_id"])
+        if old is not None:
+            self._unindex(old)
+        self._by_id[record["user_id"]] = record
+        self._index(record)
+        self._versions[record["user_id"]] = version
+
+    # --- Служебные данные (задания планировщика и т.п.) ---
+
+    def get_meta(self, key, default=None):
+        self._sync()
+        return self._meta.get(key, default)
+
+    def get_meta_items(self, prefix):
+        """{ключ: значение} служебных данных с ключами, начинающимися с prefix"""
+        self._sync()
+        return {key: value for key, value in self._meta.items() if key.startswith(prefix)}
+
+    def set_meta(self, key, value):
+        """value должен сериализоваться в JSON; на диск уходит вместе с участниками"""
+        self._meta[key] = value
+        self._dirty_meta.add(key)
+        self._schedule_flush()
+
+    def delete_meta(self, key):
+        if key in self._meta:
+            del self._meta[key]
+            self._dirty_meta.add(key)
+            self._schedule_flush()
+
+    # --- Чтение ---
+
+    def get(self, user_id):
+        self._sync()
+        return self._by_id.get(user_id)
+
+    def version(self, user_id):
+        """Текущая версия записи (0 — записи ещё нет)"""
+        self._sync()
+        return self._versions.get(user_id, 0)
+
+    def with_status(self, status):
+        self._sync()
+        return [self._by_id[user_id] for user_id in self._by_status.get(status, ())]
+
+    def all(self):
+        self._sync()
+        return list(self._by_id.values())
+
+    def page(self, offset, limit):
+        """Записи с offset по offset + limit в порядке добавления"""
+        self._sync()
+        return list(itertools.islice(self._by_id.values(), offset, offset + limit))
+
+    def count_by_status(self):
+        """Сколько участников в каждом статусе — из индекса, без обхода записей"""
+        self._sync()
+        return {status: len(user_ids) for status, user_ids in self._by_status.items() if user_ids}
+
+    async def eligible_for_reminder(self):
+        """Участники, которым нужно напоминание: все, кроме отказавшихся"""
+        if hasattr(self.backend, "eligible_for_reminder"):
+            # Сначала сбрасываем несохранённое, потом — запрос по индексу
+            await self.flush()
+            async with self._write_lock:
+                with span("storage.eligible_query"), REGISTRY.timer("storage_seconds", operation="eligible_query"):
+                    return await asyncio.to_thread(self.backend.eligible_for_reminder)
+        return [
+            record
+            for status, user_ids in self._by_status.items()
+            if status != "declined"
+            for record in (self._by_id[user_id] for user_id in user_ids)
+        ]
+
+    def __len__(self):
+        self._sync()
+        return len(self._by_id)
+
+    # --- Запись ---
+
+    async def asave(self, user_data, expected_version=None):
+        """save() для event loop: с общим хранилищем транзакция идёт в потоке"""
+        if not self.shared:
+            return self.save(user_data, expected_version)
+        user_id = user_data.get("user_id")
+        if user_id is None:
+            return None
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        # Одно соединение — одна транзакция за раз: сбросы и запросы идут под тем же замком
+        async with self._write_lock:
+            with span("storage.save", user=user_id):
+                record, version = await asyncio.to_thread(
+                    self.backend.save_versioned, user_id, user_data, expected_version)
+        self._apply(record, version)
+        return version
+
+    def save(self, user_data, expected_version=None):
+        """Обновляет только переданные поля записи (или создаёт её). Возвращает новую версию.
+
+        С общим хранилищем — только вне event loop (скрипты); в обработчиках — asave().
+        """
+        user_id = user_data.get("user_id")
+        if user_id is None:
+            return None
+        if self.shared:
+            # Версию сверяет сама транзакция: другой воркер мог изменить запись только что
+            with span("storage.save", user=user_id):
+                record, version = self.backend.save_versioned(user_id, user_data, expected_version)
+            self._apply(record, version)
+            return version
+        if expected_version is not None and self.version(user_id) != expected_version:
+            raise VersionConflict(user_id)
+        record = self._by_id.get(user_id)
+        if record is None:
+            record = dict(user_data)
+            self._by_id[user_id] = record
+        else:
+            self._unindex(record)
+            record.update(user_data)
+        self._index(record)
+        self._versions[user_id] = self.version(user_id) + 1
+        self._mark_dirty(user_id)
+        return self._versions[user_id]
+
+    def reset_gifts(self):
+        self._sync()
+        for user_id, record in self._by_id.items():
+            record["gift_requested"] = False  # сбрасываем у всех
+            self._versions[user_id] = self.version(user_id) + 1
+        if hasattr(self.backend, "reset_gifts"):
+            # Хранилище умеет сбросить всё одной операцией
+            self._pending_reset = True
+        else:
+            self._dirty.update(self._by_id)
+        self._schedule_flush()
+
+    # --- Индексы ---
+
+    def _index(self, record):
+        user_id = record["user_id"]
+        self._by_status.setdefault(record.get("status", "no_response"), set()).add(user_id)
+
+    def _unindex(self, record):
+        user_id = record["user_id"]
+        self._by_status.get(record.get("status", "no_response"), set()).discard(user_id)
+
+    # --- Сброс на диск ---
+
+    def _mark_dirty(self, user_id):
+        self._dirty.add(user_id)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (например, из скрипта) — пишем сразу
+            self._write(self._take_dirty())
+            return
+        self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        # shield: отмена задачи не должна оборвать уже начатую запись
+        await asyncio.shield(self.flush())
+
+    def _take_dirty(self):
+        # Копии записей, чтобы поток записи не видел изменений из handler'ов
+        changed = [dict(self._by_id[user_id]) for user_id in self._dirty if user_id in self._by_id]
+        self._dirty = set()
+        return changed
+
+    def _snapshot(self):
+        # Может вызываться из потока записи: list() снимает значения словаря за один шаг
+        return [dict(record) for record in list(self._by_id.values())]
+
+    def _take_dirty_meta(self):
+        changed_keys = self._dirty_meta
+        self._dirty_meta = set()
+        return json.loads(json.dumps(self._meta)), changed_keys
+
+    def _write(self, changed):
+        if self._pending_reset:
+            self._pending_reset = False
+            self.backend.reset_gifts()
+        self.backend.persist(changed, self._snapshot)
+        if self._dirty_meta:
+            self.backend.persist_meta(*self._take_dirty_meta())
+
+    async def flush(self):
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            if not self._dirty and not self._pending_reset and not self._dirty_meta:
+                return
+            dirty_ids = set(self._dirty)
+            reset = self._pending_reset
+            self._pending_reset = False
+            changed = self._take_dirty()
+            meta, changed_keys = self._take_dirty_meta()
+            try:
+                await asyncio.to_thread(self._persist, reset, changed, meta, changed_keys)
+            except Exception:
+                # Не потеряли изменения — попробуем ещё раз при следующем сбросе
+                self._dirty |= dirty_ids
+                self._dirty_meta |= changed_keys
+                self._pending_reset = self._pending_reset or reset
+                log.exception("Ошибка сохранения участников")
+
+    def _persist(self, reset, changed, meta, changed_keys):
+        with span("storage.flush", records=len(changed)), REGISTRY.timer("storage_seconds", operation="flush"):
+            self._persist_batch(reset, changed, meta, changed_keys)
+        REGISTRY.inc("storage_records_written", len(changed))
+
+    def _persist_batch(self, reset, changed, meta, changed_keys):
+        if reset:
+            self.backend.reset_gifts()
+        # Снимок — только если хранилище решит, что он нужен, и уже после сброса подарков
+        self.backend.persist(changed, self._snapshot)
+        if changed_keys:
+            self.backend.persist_meta(meta, changed_keys)
+
+    async def close(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        if getattr(self.backend, "journal_lines", 0):
+            # Сворачиваем журнал в снимок: следующий запуск читает один файл, не проигрывая журнал
+            await asyncio.to_thread(self.backend.compact, self._snapshot())
+        self.backend.close()
+
+
+if __name__ == "__main__":
+    # python storage.py participants.json participants.db
+    if len(sys.argv) != 3:
+        print("Использование: python storage.py <participants.json> <participants.db>")
+        sys.exit(1)
+    count = migrate_json_to_sqlite(sys.argv[1], sys.argv[2])
+    print(f"Перенесено участников: {count}")
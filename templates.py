@@ -0,0 +1,148 @@
+"""Тексты бота на нескольких языках (texts.json), разобранные один раз при запуске.
+
+Шаблон — строка с полями {имя}. При загрузке он разбирается на куски; поля,
+известные заранее (адрес и дата мероприятия), подставляются один раз в
+events.Event, так что на обновление остаётся склеить куски с полями
+пользователя. Шаблон без полей сразу превращается в готовую строку.
+
+Язык выбирается по language_code пользователя; ключей, которых нет в
+переводе, берутся из языка по умолчанию.
+"""
+import json
+import string
+from functools import cached_property
+from pathlib import Path
+
+from aiogram import types
+from pydantic import ConfigDict
+
+
+class _Field:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Template:
+    """Разобранный шаблон: render() только склеивает готовые куски"""
+
+    __slots__ = ("parts", "fields")
+
+    def __init__(self, parts):
+        merged = []
+        for part in parts:
+            if isinstance(part, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += part
+            elif part != "":
+                merged.append(part)
+        self.parts = tuple(merged)
+        self.fields = frozenset(part.name for part in self.parts if isinstance(part, _Field))
+
+    @classmethod
+    def compile(cls, source):
+        parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            parts.append(literal)
+            if field is not None:
+                if not field.isidentifier() or spec or conversion:
+                    raise ValueError(f"{source!r}: поддерживаются только поля вида {{имя}}, а не {{{field}}}")
+                parts.append(_Field(field))
+        return cls(parts)
+
+    def bind(self, **values):
+        """Подставляет известные поля; без оставшихся полей возвращает готовую строку"""
+        template = Template([
+            str(values[part.name]) if isinstance(part, _Field) and part.name in values else part
+            for part in self.parts
+        ])
+        return template if template.fields else "".join(template.parts)
+
+    def render(self, **values):
+        return "".join([part if part.__class__ is str else str(values[part.name]) for part in self.parts])
+
+
+def compile_texts(value):
+    """Строки — в шаблоны (без полей — как есть), списки и словари — поэлементно"""
+    if isinstance(value, str):
+        return Template.compile(value).bind()
+    if isinstance(value, list):
+        return tuple(compile_texts(item) for item in value)
+    if isinstance(value, dict):
+        return {key: compile_texts(item) for key, item in value.items()}
+    raise ValueError(f"Ожидались строки, списки или словари, а не {value!r}")
+
+
+def bind_texts(value, **values):
+    """Подставляет поля во все шаблоны вложенной структуры"""
+    if isinstance(value, Template):
+        return value.bind(**values)
+    if isinstance(value, tuple):
+        return tuple(bind_texts(item, **values) for item in value)
+    if isinstance(value, dict):
+        return {key: bind_texts(item, **values) for key, item in value.items()}
+    return value
+
+
+def localized(value, locale, default_locale):
+    """Поле настроек, заданное строкой или словарём {"ru": ..., "en": ...}"""
+    if isinstance(value, dict):
+        return value.get(locale) or value.get(default_locale) or next(iter(value.values()))
+    return value
+
+
+class TextCatalog:
+    """Все языки из texts.json; texts(language_code) — словарь шаблонов нужного языка"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.default = None
+        self.locales = {}
+        self._by_code = {}
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        self.default = raw["default"]
+        base = compile_texts(raw["locales"][self.default])
+        self.locales = {self.default: base}
+        for locale, texts in raw["locales"].items():
+            if locale != self.default:
+                # Чего нет в переводе — берём из языка по умолчанию
+                self.locales[locale] = {**base, **compile_texts(texts)}
+        self._by_code = {}
+
+    def locale(self, language_code):
+        """Язык для language_code из Telegram ("en-US" -> "en"); незнакомый — язык по умолчанию"""
+        locale = self._by_code.get(language_code)
+        if locale is None:
+            code = (language_code or "").split("-")[0].lower()
+            locale = code if code in self.locales else self.default
+            self._by_code[language_code] = locale
+        return locale
+
+    def texts(self, language_code=None):
+        return self.locales[self.locale(language_code)]
+
+
+class FrozenKeyboard(types.InlineKeyboardMarkup):
+    """Inline-клавиатура, собранная один раз: менять её нельзя, а JSON для
+    запроса готовится при первой отправке и дальше переиспользуется
+    (см. outbound.TunedAiohttpSession)"""
+
+    model_config = ConfigDict(frozen=True)
+
+    @cached_property
+    def serialized(self):
+        return json.dumps(self.model_dump(exclude_none=True))
+
+
+def keyboard(rows):
+    """FrozenKeyboard из строк кнопок [(текст, callback_data или {"url": ...}), ...]"""
+    return FrozenKeyboard(inline_keyboard=[
+        [
+            types.InlineKeyboardButton(text=text, **(action if isinstance(action, dict) else {"callback_data": action}))
+            for text, action in row
+        ]
+        for row in rows
+    ])
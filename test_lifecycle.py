@@ -0,0 +1,52 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from lifecycle import Lifecycle
+from storage import JournalBackend, ParticipantStore
+
+
+class LifecycleRedeliveryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = ParticipantStore(JournalBackend(Path(self.dir.name) / "participants.json"))
+        self.store.load()
+
+    def tearDown(self):
+        self.store.backend.close()
+        self.dir.cleanup()
+
+    def test_redelivery_while_first_is_running_is_skipped(self):
+        async def scenario():
+            lifecycle = Lifecycle(self.store)
+            release = asyncio.Event()
+            calls = []
+
+            async def handler(update, data):
+                calls.append(update.update_id)
+                await release.wait()
+                return "handled"
+
+            update = SimpleNamespace(update_id=100)
+            first = asyncio.create_task(lifecycle(handler, update, {}))
+            await asyncio.sleep(0)
+            # Telegram не дождался ответа и прислал то же обновление, пока первое ещё идёт
+            second = await asyncio.wait_for(lifecycle(handler, update, {}), 1)
+            release.set()
+            first = await first
+            # И ещё раз — уже после завершения
+            third = await lifecycle(handler, update, {})
+            return calls, first, second, third, lifecycle.skipped
+
+        calls, first, second, third, skipped = asyncio.run(scenario())
+        self.assertEqual(calls, [100])
+        self.assertEqual(first, "handled")
+        self.assertIsNone(second)
+        self.assertIsNone(third)
+        self.assertEqual(skipped, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
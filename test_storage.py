@@ -0,0 +1,80 @@
+import asyncio
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from storage import JournalBackend, ParticipantStore, SharedSqliteBackend
+
+
+class JournalCompactionTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.dir.name) / "participants.json"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def open_store(self):
+        store = ParticipantStore(JournalBackend(self.path, compact_after=3))
+        store.load()
+        return store
+
+    def test_reset_at_compaction_boundary_keeps_participants(self):
+        async def scenario():
+            store = self.open_store()
+            store.save({"user_id": 1, "username": "a", "gift_requested": True})
+            await store.flush()
+            store.save({"user_id": 2, "username": "b", "gift_requested": True})
+            await store.flush()
+            # Третья строка журнала — сброс подарков, после неё хранилище сворачивает журнал в снимок
+            store.reset_gifts()
+            await store.flush()
+            store.backend.close()
+
+        asyncio.run(scenario())
+
+        records = sorted(self.open_store().all(), key=lambda record: record["user_id"])
+        self.assertEqual([record["user_id"] for record in records], [1, 2])
+        self.assertFalse(any(record["gift_requested"] for record in records))
+
+
+
+class SharedSqliteReadTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.dir.name) / "participants.db"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_get_does_not_wait_for_write_lock(self):
+        async def scenario():
+            store = ParticipantStore(SharedSqliteBackend(self.path, busy_timeout=2.0))
+            store.load()
+            await store.asave({"user_id": 1, "status": "confirmed"})
+
+            other = sqlite3.connect(self.path, isolation_level=None)
+            # Чужой коммит — чтобы get() пошёл дочитывать изменения
+            other.execute("INSERT INTO meta (key, value) VALUES ('x', '1')")
+            other.execute("BEGIN IMMEDIATE")
+            # Сохранение ждёт блокировку другого воркера в потоке
+            pending = asyncio.create_task(store.asave({"user_id": 2, "status": "declined"}))
+            await asyncio.sleep(0.2)
+            started = time.perf_counter()
+            record = store.get(1)
+            elapsed = time.perf_counter() - started
+            other.execute("ROLLBACK")
+            other.close()
+            await pending
+            await store.close()
+            return record, elapsed
+
+        record, elapsed = asyncio.run(scenario())
+        self.assertEqual(record["status"], "confirmed")
+        self.assertLess(elapsed, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
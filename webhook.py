@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import secrets
+
+from aiohttp import web
+from aiogram.types import Update
+
+# Заголовок, в котором Telegram присылает secret_token из set_webhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+log = logging.getLogger(__name__)
+
+
+class WebhookServer:
+    """Приём обновлений через webhook встроенным aiohttp-сервером.
+
+    Telegram получает 200 только после обработки обновления; одновременно
+    обрабатывается не больше max_inflight, при достижении лимита новый
+    запрос ждёт, пока освободится место (Telegram сам притормозит отправку).
+    Если base_url не задан, webhook в Telegram не регистрируется — так сервер
+    удобно проверять локально, отправляя POST с JSON обновления.
+
+    При остановке сервер перестаёт принимать соединения и ждёт идущие
+    обработки не дольше drain_timeout секунд, оставшиеся отменяет. Ответа
+    на них Telegram не получит и пришлёт обновления снова — после
+    перезапуска или через getUpdates.
+    """
+
+    def __init__(self, bot, dp, host="0.0.0.0", port=8080, path="/webhook",
+                 base_url=None, secret=None, max_inflight=100, drain_timeout=10.0):
+        self.bot = bot
+        self.dp = dp
+        self.host = host
+        self.port = port
+        self.path = path
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.secret = secret or secrets.token_urlsafe(32)
+        self._slots = asyncio.Semaphore(max_inflight)
+        self.drain_timeout = drain_timeout
+        self._inflight = 0
+
+    def inflight(self):
+        """Сколько обновлений обрабатывается прямо сейчас"""
+        return self._inflight
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request):
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.model_validate(data, context={"bot": self.bot})
+        except ValueError:
+            return web.Response(status=400)
+
+        # Отвечаем после обработки: отменённое при остановке обновление Telegram доставит повторно.
+        # Долгое (анимация подарка) обработчики сами уводят в отдельные задачи
+        async with self._slots:
+            self._inflight += 1
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                # Ошибка в обработчике повтором не лечится — подтверждаем, чтобы Telegram не слал его снова
+                log.exception("Ошибка обработки обновления %s", update.update_id)
+            finally:
+                self._inflight -= 1
+        return web.Response()
+
+    async def run(self):
+        # cleanup() закрывает приём, ждёт обработчики shutdown_timeout секунд и отменяет оставшиеся
+        runner = web.AppRunner(self.make_app(), shutdown_timeout=self.drain_timeout)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, self.port)
+        await site.start()
+        log.info("Webhook слушает http://%s:%s%s", self.host, self.port, self.path)
+        if not self.base_url:
+            # Локальная проверка: POST с этим заголовком и JSON обновления
+            log.warning("WEBHOOK_BASE_URL не задан, webhook не регистрируется. %s: %s", SECRET_HEADER, self.secret)
+
+        await self.dp.emit_startup(bot=self.bot)
+        if self.base_url:
+            await self.bot.set_webhook(
+                self.base_url + self.path,
+                secret_token=self.secret,
+                allowed_updates=self.dp.resolve_used_update_types(),
+                drop_pending_updates=False,
+            )
+        try:
+            await asyncio.Event().wait()  # работаем до отмены
+        finally:
+            if self.base_url:
+                await self.bot.delete_webhook()
+            await runner.cleanup()
+            await self.dp.emit_shutdown(bot=self.bot)
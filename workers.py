@@ -0,0 +1,196 @@
+"""Запуск бота несколькими процессами-воркерами.
+
+    python workers.py 4
+
+Поднимает N процессов main.py в режиме webhook на соседних портах и
+принимает webhook Telegram на WEBHOOK_PORT. Каждое обновление уходит
+воркеру по номеру пользователя (user_id % N), так что обновления одного
+человека обрабатываются одним процессом по порядку. Участники — в общем
+SQLite, напоминания шлёт только ведущий воркер (см. locks.LeaderElection).
+Упавший воркер перезапускается.
+
+Для проверки на одной машине без Telegram:
+
+    python bench.py --serve-api 8081
+    TELEGRAM_API_BASE=http://127.0.0.1:8081 BOT_TOKEN=123:abc python workers.py 4
+
+и POST обновлений на http://127.0.0.1:8080/webhook с заголовком секрета из вывода.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from dotenv import load_dotenv
+
+from logs import setup_logging
+from webhook import SECRET_HEADER
+
+BASE_DIR = Path(__file__).parent
+
+log = logging.getLogger("workers")
+
+# Через сколько секунд перезапускать упавший воркер
+RESTART_DELAY = 2
+
+# Сколько обработчик воркера может идти вместе с ожиданием слота и очереди отправки
+HANDLER_TIMEOUT = 60
+
+
+def update_owner(update):
+    """id пользователя (или чата), от которого пришло обновление; None — если не нашли"""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        for field in ("from", "user", "chat"):
+            owner = value.get(field)
+            if isinstance(owner, dict) and "id" in owner:
+                return owner["id"]
+        message = value.get("message")
+        if isinstance(message, dict) and isinstance(message.get("chat"), dict):
+            return message["chat"]["id"]
+    return None
+
+
+class UpdateRouter:
+    """Принимает webhook и пересылает обновление воркеру по user_id"""
+
+    def __init__(self, worker_urls, secret, timeout=HANDLER_TIMEOUT):
+        self.worker_urls = worker_urls
+        self.secret = secret
+        # Воркер отвечает после обработки, а при остановке ещё дожидается идущих:
+        # раньше срока роутер ответил бы 503, и Telegram прислал бы обновление повторно
+        self.timeout = timeout
+        self._session = None
+
+    def pick(self, update):
+        owner = update_owner(update)
+        key = owner if owner is not None else update.get("update_id", 0)
+        return self.worker_urls[key % len(self.worker_urls)]
+
+    async def handle(self, request):
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=403)
+        body = await request.read()
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(update, dict):
+            return web.Response(status=400)
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        try:
+            async with self._session.post(
+                self.pick(update), data=body,
+                headers={SECRET_HEADER: self.secret, "Content-Type": "application/json"},
+            ) as response:
+                return web.Response(status=response.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Воркер перезапускается — Telegram повторит доставку позже
+            return web.Response(status=503)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def run_worker(index, env, stopping):
+    """Держит воркер запущенным, пока не попросили остановиться"""
+    while not stopping.is_set():
+        process = await asyncio.create_subprocess_exec(sys.executable, str(BASE_DIR / "main.py"), env=env)
+        try:
+            await process.wait()
+        except asyncio.CancelledError:
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+            raise
+        if stopping.is_set():
+            break
+        log.warning("Воркер %d завершился с кодом %s, перезапуск через %s с", index, process.returncode, RESTART_DELAY)
+        await asyncio.sleep(RESTART_DELAY)
+
+
+async def main(count):
+    load_dotenv()
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FILE"))
+    token = os.environ["BOT_TOKEN"]
+    host = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    port = int(os.getenv("WEBHOOK_PORT", "8080"))
+    path = os.getenv("WEBHOOK_PATH", "/webhook")
+    base_url = os.getenv("WEBHOOK_BASE_URL")
+    secret = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+    metrics_port = int(os.getenv("METRICS_PORT", "9108"))
+    shutdown_timeout = float(os.getenv("SHUTDOWN_TIMEOUT", "10"))
+
+    worker_urls = []
+    tasks = []
+    stopping = asyncio.Event()
+    for index in range(count):
+        worker_port = port + 1 + index
+        env = dict(
+            os.environ,
+            BOT_MODE="webhook",
+            WEBHOOK_HOST="127.0.0.1",
+            WEBHOOK_PORT=str(worker_port),
+            WEBHOOK_SECRET=secret,
+            WEBHOOK_BASE_URL="",  # webhook в Telegram регистрирует только этот процесс
+            WORKERS=str(count),
+            WORKER_ID=str(index),
+            STORAGE_BACKEND="sqlite",
+            METRICS_PORT=str(metrics_port + index if metrics_port else 0),
+        )
+        worker_urls.append(f"http://127.0.0.1:{worker_port}{path}")
+        tasks.append(asyncio.create_task(run_worker(index, env, stopping)))
+
+    router = UpdateRouter(worker_urls, secret, timeout=shutdown_timeout + HANDLER_TIMEOUT)
+    app = web.Application()
+    app.router.add_post(path, router.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("Воркеров: %d; webhook слушает http://%s:%s%s", count, host, port, path)
+
+    session = AiohttpSession()
+    if os.getenv("TELEGRAM_API_BASE"):
+        session.api = TelegramAPIServer.from_base(os.environ["TELEGRAM_API_BASE"])
+    bot = Bot(token=token, session=session)
+    if base_url:
+        await bot.set_webhook(base_url.rstrip("/") + path, secret_token=secret,
+                              allowed_updates=["message", "callback_query"], drop_pending_updates=False)
+    else:
+        log.warning("WEBHOOK_BASE_URL не задан, webhook не регистрируется. %s: %s", SECRET_HEADER, secret)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await stopping.wait()
+    finally:
+        stopping.set()
+        if base_url:
+            await bot.delete_webhook()
+        await bot.session.close()
+        await runner.cleanup()
+        await router.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 2))